@@ -88,9 +88,6 @@ const FileUpload: React.FC<FileUploadProps> = ({ projectUuid, onUploadSuccess })
       files.forEach(file => {
         formData.append('files', file);
       });
-      
-      // Add project UUID to the request
-      formData.append('projectUuid', projectUuid);
 
       const token = localStorage.getItem('token');
       if (!token) {
@@ -98,7 +95,8 @@ const FileUpload: React.FC<FileUploadProps> = ({ projectUuid, onUploadSuccess })
       }
 
       const xhr = new XMLHttpRequest();
-      xhr.open('POST', '/api/projects/upload', true);
+      // Streamed to disk and registered as one batch, no 16 MB request cap
+      xhr.open('POST', `/api/projects/uuid/${projectUuid}/images`, true);
       xhr.setRequestHeader('Authorization', `Bearer ${token}`);
       
       xhr.upload.onprogress = (event) => {
@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useToast } from '../context/ToastContext';
+import { MediaAccess, mediaQuery } from '../services/Api';
 
 interface ImageData {
   id: number;
@@ -12,6 +13,15 @@ interface ImageData {
   user_id: number;
 }
 
+interface ImagePage {
+  images: ImageData[];
+  next_cursor: number | null;
+  media: MediaAccess;
+}
+
+// Number of images requested per page from the listing endpoint
+const PAGE_SIZE = 100;
+
 interface ImageGalleryProps {
   projectUuid: string;
   onImageSelect?: (imageUrl: string) => void;
@@ -22,6 +32,9 @@ const ImageGallery: React.FC<ImageGalleryProps> = ({ projectUuid, onImageSelect,
   const [images, setImages] = useState<ImageData[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
+  const [nextCursor, setNextCursor] = useState<number | null>(null);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
+  const [media, setMedia] = useState<MediaAccess | null>(null);
   const [openDropdownId, setOpenDropdownId] = useState<string | null>(null);
   const dropdownRef = useRef<HTMLDivElement>(null);
   const { showToast } = useToast();
@@ -29,34 +42,51 @@ const ImageGallery: React.FC<ImageGalleryProps> = ({ projectUuid, onImageSelect,
   // Function to get secure image URL with authentication
   const getSecureImageUrl = (filePath: string): string => {
     const relativePath = filePath.split('/').slice(1).join('/');
+    return `/api/images/${relativePath}?${mediaQuery(media)}`;
+  };
+
+  // Grid tiles use server-side thumbnails (longest side in px) instead of the original
+  const getThumbnailUrl = (filePath: string, size: number): string => {
+    const relativePath = filePath.split('/').slice(1).join('/');
+    return `/api/thumbnails/${size}/${relativePath}?${mediaQuery(media)}`;
+  };
+
+  // Fetch one keyset page of images, starting after the given cursor
+  const fetchImagePage = async (after: number | null): Promise<ImagePage> => {
     const token = localStorage.getItem('token');
-    return `/api/images/${relativePath}?token=${token}`;
+    if (!token) {
+      throw new Error('Authentication token is missing');
+    }
+
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+    if (after !== null) {
+      params.set('after', String(after));
+    }
+
+    const response = await fetch(`/api/projects/uuid/${projectUuid}/images?${params}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      }
+    });
+
+    if (!response.ok) {
+      if (response.status === 401) {
+        throw new Error('Authentication failed: Invalid or expired token');
+      }
+      throw new Error('Failed to fetch images');
+    }
+
+    return await response.json();
   };
 
   useEffect(() => {
     const fetchImages = async () => {
       setLoading(true);
       try {
-        const token = localStorage.getItem('token');
-        if (!token) {
-          throw new Error('Authentication token is missing');
-        }
-
-        const response = await fetch(`/api/projects/uuid/${projectUuid}/images`, {
-          headers: {
-            'Authorization': `Bearer ${token}`,
-          }
-        });
-
-        if (!response.ok) {
-          if (response.status === 401) {
-            throw new Error('Authentication failed: Invalid or expired token');
-          }
-          throw new Error('Failed to fetch images');
-        }
-
-        const data = await response.json();
-        setImages(data);
+        const page = await fetchImagePage(null);
+        setMedia(page.media);
+        setImages(page.images);
+        setNextCursor(page.next_cursor);
       } catch (err) {
         console.error('Error fetching images:', err);
         if (err instanceof Error) {
@@ -76,6 +106,22 @@ const ImageGallery: React.FC<ImageGalleryProps> = ({ projectUuid, onImageSelect,
     }
   }, [projectUuid, showToast]);
 
+  const handleLoadMore = async () => {
+    if (nextCursor === null) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchImagePage(nextCursor);
+      setMedia(page.media);
+      setImages(prev => [...prev, ...page.images]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      console.error('Error fetching images:', err);
+      showToast(err instanceof Error ? err.message : 'Failed to load images', 'error');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Close dropdown when clicking outside
   useEffect(() => {
     const handleClickOutside = (event: MouseEvent) => {
@@ -191,9 +237,9 @@ const ImageGallery: React.FC<ImageGalleryProps> = ({ projectUuid, onImageSelect,
   return (
     <div className="space-y-6">
       <div className="flex justify-between items-center">
-        <h2 className="text-lg font-medium">Project Images ({images.length})</h2>
+        <h2 className="text-lg font-medium">Project Images ({images.length}{nextCursor !== null ? '+' : ''})</h2>
         <div className="text-sm text-gray-500">
-          Total: {images.length} image{images.length !== 1 ? 's' : ''}
+          Loaded: {images.length} image{images.length !== 1 ? 's' : ''}
         </div>
       </div>
 
@@ -209,7 +255,9 @@ const ImageGallery: React.FC<ImageGalleryProps> = ({ projectUuid, onImageSelect,
           >
             <div className="h-32 bg-gray-100 flex items-center justify-center overflow-hidden">
               <img 
-                src={getSecureImageUrl(image.file_path)} 
+                src={getThumbnailUrl(image.file_path, 256)}
+                srcSet={`${getThumbnailUrl(image.file_path, 256)} 1x, ${getThumbnailUrl(image.file_path, 512)} 2x`}
+                loading="lazy"
                 alt={image.original_filename}
                 className="object-cover w-full h-full"
               />
@@ -266,6 +314,18 @@ const ImageGallery: React.FC<ImageGalleryProps> = ({ projectUuid, onImageSelect,
           </div>
         ))}
       </div>
+
+      {nextCursor !== null && (
+        <div className="flex justify-center">
+          <button
+            onClick={handleLoadMore}
+            disabled={loadingMore}
+            className="bg-indigo-600 text-white px-4 py-2 rounded hover:bg-indigo-700 disabled:opacity-50"
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
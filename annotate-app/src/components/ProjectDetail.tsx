@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from "react";
 import { useParams, useNavigate } from "react-router-dom";
-import { fetchProjectById, ProjectsInterface, ImageData } from "../services/Api";
+import { fetchProjectById, mediaQuery, ProjectsInterface, ImageData } from "../services/Api";
 import { useAuth } from "../context/AuthContext";
 import FileUpload from './FileUpload';
 import ImageGallery from './ImageGallery';
@@ -77,10 +77,9 @@ const ProjectDetail: React.FC = () => {
   };
 
   const getSecureImageUrl = (filePath: string) => {
-    const token = localStorage.getItem('token');
     // Remove 'uploads/' from the file path if it exists
     const cleanPath = filePath.replace('uploads/', '');
-    return `/api/images/${cleanPath}?token=${token}`;
+    return `/api/images/${cleanPath}?${mediaQuery(project?.media)}`;
   };
 
   if (loading) {
@@ -6,11 +6,28 @@ export interface ImageData {
   original_filename: string;
   file_path: string;
   file_size: number;
+  // null for images whose header couldn't be read
+  width: number | null;
+  height: number | null;
   upload_date: string;
   project_id: number;
   user_id: number;
 }
 
+// Signed query parameters for a project's image URLs, returned with project
+// and image listings; stable for a day so the browser cache keeps hitting
+export interface MediaAccess {
+  expires: number;
+  signature: string;
+}
+
+export const mediaQuery = (media?: MediaAccess | null): string => {
+  if (media) {
+    return `expires=${media.expires}&signature=${media.signature}`;
+  }
+  return `token=${localStorage.getItem('token')}`;
+};
+
 export interface Label {
   id: number;
   name: string;
@@ -26,6 +43,7 @@ export interface ProjectsInterface {
   date_updated: string;
   type?: string;
   images?: ImageData[];
+  media?: MediaAccess;
 }
 
 export const fetchProjects = async (): Promise<Array<ProjectsInterface>> => {
@@ -163,4 +181,43 @@ export const createProjectLabel = async (projectUuid: string, name: string): Pro
   }
 
   return response.json();
-};
\ No newline at end of file
+};
+
+export interface AnnotationData {
+  id: number;
+  x: number;
+  y: number;
+  width: number;
+  height: number;
+  label: { id: number; name: string };
+  created_at: string;
+}
+
+export interface AnnotationBatch {
+  create?: Array<{ image_uuid: string; label_id: number; x: number; y: number; width: number; height: number }>;
+  update?: Array<{ id: number; label_id?: number; x?: number; y?: number; width?: number; height?: number }>;
+  delete?: number[];
+}
+
+// Saves many annotation changes in one request; returns annotations grouped by image uuid
+export const saveAnnotationsBatch = async (batch: AnnotationBatch): Promise<Record<string, AnnotationData[]>> => {
+  const token = localStorage.getItem('token');
+  if (!token) {
+    throw new Error("Authentication token is missing");
+  }
+
+  const response = await fetch('/api/annotations/batch', {
+    method: 'POST',
+    headers: {
+      'Authorization': `Bearer ${token}`,
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(batch),
+  });
+
+  if (!response.ok) {
+    throw new Error("Failed to save annotations");
+  }
+
+  return response.json();
+};
@@ -1,24 +1,40 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_file
 from flask_cors import CORS
+import click
 import os
 import mimetypes
 import datetime
 import functools
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 
 from proejcts import *
 from auth import AuthController
+from dataset_exporter import DatasetExporter, ARCHIVE_FORMATS
+from dataset_importer import DatasetImporter
+from jobs import JobsController
 
 # Very important "fix" for sending js as text/javascript, not like text/plain
 mimetypes.add_type('text/css', '.css')
 mimetypes.add_type('text/javascript', '.js')
 
-# Allowed file extensions
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
+# Largest page served by paginated listing endpoints
+MAX_PAGE_SIZE = 1000
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Allowed file extensions (images: ALLOWED_EXTENSIONS from proejcts)
+ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm', 'm4v'}
+
+# Dataset archives: .zip, .tar and compressed tars
+ALLOWED_ARCHIVE_EXTENSIONS = {'zip', 'tar', 'tgz', 'tar.gz', 'tar.bz2', 'tar.xz'}
+
+# What a resumable upload can become, with the extensions allowed for each
+UPLOAD_KINDS = {'image': ALLOWED_EXTENSIONS, 'video': ALLOWED_VIDEO_EXTENSIONS,
+                'archive': ALLOWED_ARCHIVE_EXTENSIONS}
+
+def allowed_file(filename, extensions=ALLOWED_EXTENSIONS):
+    # Extensions may span several suffixes, e.g. 'tar.gz'
+    filename = filename.lower()
+    return any(filename.endswith('.' + extension) for extension in extensions)
 
 template_dir = os.path.abspath('../annotate-app/dist')
 app = Flask(__name__, template_folder=template_dir, static_folder=template_dir + '/assets')
@@ -26,6 +42,17 @@ CORS(app)  # Enable CORS for all routes
 
 # Set maximum file upload size to 16MB
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# Video uploads are streamed to disk and get their own, larger limit
+MAX_VIDEO_SIZE = int(os.environ.get('MAX_VIDEO_SIZE', 8 * 1024 * 1024 * 1024))
+# Dataset archives are streamed to disk and imported by a background job
+MAX_ARCHIVE_SIZE = int(os.environ.get('MAX_ARCHIVE_SIZE', 64 * 1024 * 1024 * 1024))
+# Resumable uploads: largest declared file and largest single chunk request
+MAX_RESUMABLE_UPLOAD_SIZE = int(os.environ.get('MAX_RESUMABLE_UPLOAD_SIZE', 64 * 1024 * 1024 * 1024))
+MAX_UPLOAD_CHUNK_SIZE = int(os.environ.get('MAX_UPLOAD_CHUNK_SIZE', 64 * 1024 * 1024))
+# Batch image uploads are streamed to disk part by part
+MAX_BATCH_UPLOAD_SIZE = int(os.environ.get('MAX_BATCH_UPLOAD_SIZE', 16 * 1024 * 1024 * 1024))
+# Browser cache lifetime of uploaded images and thumbnails (one year)
+MEDIA_MAX_AGE = 365 * 24 * 3600
 
 # app = Flask(__name__, static_folder='static/assets', static_url_path='/assets')
 root = os.path.dirname(os.path.abspath(__file__))
@@ -33,6 +60,18 @@ root = os.path.dirname(os.path.abspath(__file__))
 
 g_projects = ProjectsController(root)
 g_auth = AuthController()
+g_jobs = JobsController(root)
+
+# Give the request thread's DB session back to the pool once the request ends
+@app.teardown_appcontext
+def shutdown_session(exception=None):
+    remove_sessions()
+
+# Under a WSGI server the first request is the first sign this process
+# serves the app; recovery runs once per server start, in one process
+@app.before_request
+def recover_jobs_on_startup():
+    g_jobs.recover_on_startup()
 
 # Authentication middleware
 def token_required(f):
@@ -111,10 +150,17 @@ def api_project_get(project_id):
 @token_required
 def api_project_get_by_uuid(project_uuid):
     user_id = request.current_user['id']
-    project = g_projects.get_project_by_uuid(project_uuid, user_id)
+    
+    # The full image list is embedded unless the caller opts out with ?images=false
+    if request.args.get('images', 'true').lower() in ('false', '0'):
+        project = g_projects.get_project_by_uuid(project_uuid, user_id)
+    else:
+        project = g_projects.get_project_with_images(project_uuid, user_id)
     
     if not project:
         return jsonify({"error": "Project not found"}), 404
+    # Query parameters for the project's image URLs
+    project["media"] = g_auth.sign_media(project_uuid)
         
     return jsonify(project), 200
 
@@ -194,6 +240,225 @@ def api_projects_upload():
         "files": uploaded_files
     }), 200
 
+# High-volume image upload: a multipart body with any number of 'files' parts.
+# Parts are written straight to the project folder while the body arrives and
+# the batch is registered in one transaction; disallowed files are skipped.
+@app.route('/api/projects/uuid/<string:project_uuid>/images', methods=['POST'])
+@token_required
+def api_project_images_upload(project_uuid):
+    user_id = request.current_user['id']
+    request.max_content_length = MAX_BATCH_UPLOAD_SIZE
+    
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        return jsonify({"error": "Expected a multipart/form-data body"}), 400
+    
+    images, rejected, error = g_projects.upload_images_stream(
+        project_uuid, request.stream, boundary, allowed_file, user_id
+    )
+    if error:
+        return jsonify({"error": error}), 400
+    
+    return jsonify({
+        "message": f"Successfully uploaded {len(images)} files",
+        "files": images,
+        "rejected": rejected
+    }), 200
+
+def video_job_options():
+    """Frame extraction options from the query string, returns (options, error)"""
+    frame_interval = request.args.get('frame_interval', 1, type=int)
+    max_frames = request.args.get('max_frames', type=int)
+    if frame_interval < 1:
+        return None, "frame_interval must be a positive integer"
+    # Sampling by time: ?target_fps=1&start_time=60&end_time=120 (seconds)
+    target_fps = request.args.get('target_fps', type=float)
+    start_time = request.args.get('start_time', type=float)
+    end_time = request.args.get('end_time', type=float)
+    if target_fps is not None and target_fps <= 0:
+        return None, "target_fps must be positive"
+    # Frame encoding: ?format=jpg|png|webp&quality=90
+    image_format = request.args.get('format', 'jpg').lower()
+    quality = request.args.get('quality', type=int)
+    if image_format not in ('jpg', 'jpeg', 'png', 'webp'):
+        return None, f"Unsupported frame format: {image_format}"
+    # Near-duplicate suppression: ?dedup=5 drops frames within 5 of 64 hash bits
+    # of the last kept frame
+    dedup_threshold = request.args.get('dedup', type=int)
+    if dedup_threshold is not None and not 0 <= dedup_threshold <= 64:
+        return None, "dedup must be between 0 and 64"
+    
+    return {
+        "frame_interval": frame_interval,
+        "max_frames": max_frames,
+        "target_fps": target_fps,
+        "start_time": start_time,
+        "end_time": end_time,
+        "image_format": image_format,
+        "quality": quality,
+        "dedup_threshold": dedup_threshold
+    }, None
+
+def upload_stream():
+    """
+    File sent as the raw request body (?filename=...) or as the 'file' field
+    of a multipart form. The form is decoded while the file is saved, not
+    spooled by request.files first. Returns (filename, stream, error).
+    """
+    if request.mimetype != 'multipart/form-data':
+        return request.args.get('filename', ''), request.stream, None
+    boundary = request.mimetype_params.get('boundary')
+    if not boundary:
+        return None, None, "Expected a multipart/form-data body"
+    try:
+        stream = MultipartFileStream(request.stream, boundary)
+    except ValueError:
+        return None, None, "Invalid multipart/form-data body"
+    if stream.filename is None:
+        return None, None, "No file provided"
+    return stream.filename, stream, None
+
+# Video ingest: the body is streamed to disk and frames are extracted and
+# registered by a background job. Send the raw video as the request body
+# (?filename=clip.mp4) or as the 'file' field of a multipart form.
+@app.route('/api/projects/uuid/<string:project_uuid>/videos', methods=['POST'])
+@token_required
+def api_project_video_upload(project_uuid):
+    user_id = request.current_user['id']
+    request.max_content_length = MAX_VIDEO_SIZE
+    
+    project = g_projects.get_project_by_uuid(project_uuid, user_id)
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+    
+    options, error = video_job_options()
+    if error:
+        return jsonify({"error": error}), 400
+    
+    filename, stream, error = upload_stream()
+    if error:
+        return jsonify({"error": error}), 400
+    
+    if not allowed_file(filename, ALLOWED_VIDEO_EXTENSIONS):
+        return jsonify({"error": f"File type not allowed: {filename}"}), 400
+    
+    try:
+        video_path = g_projects.save_video(project_uuid, stream, filename)
+    except ValueError:
+        return jsonify({"error": "Invalid multipart/form-data body"}), 400
+    job, error = g_jobs.submit_video(project_uuid, video_path, filename, user_id, **options)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    return jsonify(job), 202
+
+# Dataset import: a ZIP or tar archive of images, optionally with YOLO label
+# files (labels/<split>/<name>.txt next to images/<split>/<name>.jpg) and
+# class names (data.yaml or classes.txt). The body is streamed to disk and
+# extracted by a background job. Send the raw archive as the request body
+# (?filename=dataset.zip) or as the 'file' field of a multipart form.
+@app.route('/api/projects/uuid/<string:project_uuid>/archives', methods=['POST'])
+@token_required
+def api_project_archive_upload(project_uuid):
+    user_id = request.current_user['id']
+    request.max_content_length = MAX_ARCHIVE_SIZE
+    
+    project = g_projects.get_project_by_uuid(project_uuid, user_id)
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+    
+    filename, stream, error = upload_stream()
+    if error:
+        return jsonify({"error": error}), 400
+    
+    if not allowed_file(filename, ALLOWED_ARCHIVE_EXTENSIONS):
+        return jsonify({"error": f"File type not allowed: {filename}"}), 400
+    
+    try:
+        archive_path = g_projects.save_archive(project_uuid, stream, filename)
+    except ValueError:
+        return jsonify({"error": "Invalid multipart/form-data body"}), 400
+    job, error = g_jobs.submit_archive(project_uuid, archive_path, filename, user_id)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    return jsonify(job), 202
+
+# Resumable uploads for large images, videos and dataset archives:
+#   POST   /api/projects/uuid/<uuid>/uploads  {"filename", "size", "kind": "image"|"video"|"archive"}
+#   PUT    /api/uploads/<uuid>?offset=<n>     raw chunk appended at offset n
+#   GET    /api/uploads/<uuid>                current offset, to resume after a failure
+#   POST   /api/uploads/<uuid>/complete       videos take the frame options of /videos
+#   DELETE /api/uploads/<uuid>
+@app.route('/api/projects/uuid/<string:project_uuid>/uploads', methods=['POST'])
+@token_required
+def api_upload_create(project_uuid):
+    user_id = request.current_user['id']
+    data = request.get_json() or {}
+    
+    filename = data.get('filename') or ''
+    kind = data.get('kind', 'image')
+    size = data.get('size')
+    if kind not in UPLOAD_KINDS:
+        return jsonify({"error": f"kind must be one of {sorted(UPLOAD_KINDS)}"}), 400
+    if not allowed_file(filename, UPLOAD_KINDS[kind]):
+        return jsonify({"error": f"File type not allowed: {filename}"}), 400
+    if not isinstance(size, int) or size < 1 or size > MAX_RESUMABLE_UPLOAD_SIZE:
+        return jsonify({"error": f"size must be between 1 and {MAX_RESUMABLE_UPLOAD_SIZE} bytes"}), 400
+    
+    result, status_code = g_projects.create_upload(project_uuid, filename, kind, size, user_id)
+    return jsonify(result), status_code
+
+@app.route('/api/uploads/<string:upload_uuid>', methods=['GET'])
+@token_required
+def api_upload_get(upload_uuid):
+    result, status_code = g_projects.get_upload(upload_uuid, request.current_user['id'])
+    return jsonify(result), status_code
+
+@app.route('/api/uploads/<string:upload_uuid>', methods=['PUT'])
+@token_required
+def api_upload_chunk(upload_uuid):
+    request.max_content_length = MAX_UPLOAD_CHUNK_SIZE
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({"error": "offset is required"}), 400
+    
+    result, status_code = g_projects.write_upload_chunk(
+        upload_uuid, offset, request.stream, request.current_user['id']
+    )
+    return jsonify(result), status_code
+
+@app.route('/api/uploads/<string:upload_uuid>/complete', methods=['POST'])
+@token_required
+def api_upload_complete(upload_uuid):
+    user_id = request.current_user['id']
+    options, error = video_job_options()
+    if error:
+        return jsonify({"error": error}), 400
+    
+    def finish(upload, result):
+        # Completed videos and archives go through the same jobs as /videos and /archives
+        if upload["kind"] == "video":
+            job, error = g_jobs.submit_video(upload["project_uuid"], result["video_path"],
+                                             upload["filename"], user_id, **options)
+        elif upload["kind"] == "archive":
+            job, error = g_jobs.submit_archive(upload["project_uuid"], result["archive_path"],
+                                               upload["filename"], user_id)
+        else:
+            return None
+        if error:
+            raise ValueError(error)
+        return {"job": job}
+    
+    result, status_code = g_projects.complete_upload(upload_uuid, user_id, finish)
+    return jsonify(result), status_code
+
+@app.route('/api/uploads/<string:upload_uuid>', methods=['DELETE'])
+@token_required
+def api_upload_delete(upload_uuid):
+    result, status_code = g_projects.abort_upload(upload_uuid, request.current_user['id'])
+    return jsonify(result), status_code
+
 @app.route('/api/projects/uuid/<string:project_uuid>/images', methods=['GET'])
 @token_required
 def api_project_images_get(project_uuid):
@@ -204,10 +469,41 @@ def api_project_images_get(project_uuid):
     if not project:
         return jsonify({"error": "Project not found"}), 404
     
-    # Get project images
-    images = g_projects.get_project_images(project_uuid, user_id)
+    # Optional filters, e.g. ?annotated=false or ?label_id=3
+    annotated = request.args.get('annotated')
+    if annotated is not None:
+        if annotated.lower() not in ('true', 'false', '1', '0'):
+            return jsonify({"error": "annotated must be true or false"}), 400
+        annotated = annotated.lower() in ('true', '1')
+    label_id = request.args.get('label_id', type=int)
+    order = request.args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        return jsonify({"error": "order must be asc or desc"}), 400
     
-    return jsonify(images), 200
+    # Without a limit the whole (filtered) list is returned as before
+    if 'limit' not in request.args:
+        images = g_projects.get_project_images(
+            project_uuid, user_id, order=order, annotated=annotated, label_id=label_id
+        )
+        return jsonify(images), 200
+    
+    # Keyset page: ?limit=200&after=<next_cursor of the previous page>
+    limit = request.args.get('limit', type=int)
+    if not limit or limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    limit = min(limit, MAX_PAGE_SIZE)
+    after = request.args.get('after', type=int)
+    
+    images, next_cursor = g_projects.get_project_images_page(
+        project_uuid, user_id, limit=limit, after=after, order=order,
+        annotated=annotated, label_id=label_id
+    )
+    
+    return jsonify({
+        "images": images,
+        "next_cursor": next_cursor,
+        "media": g_auth.sign_media(project_uuid)
+    }), 200
 
 @app.route('/api/projects/images/<string:image_uuid>', methods=['DELETE'])
 @token_required
@@ -228,20 +524,92 @@ def api_image_delete(image_uuid):
             "success": False
         }), 404
 
-# Serve uploaded files
-@app.route('/uploads/<path:filename>')
-def uploaded_file(filename):
-    # Public access to uploaded files (no authentication required)
-    return send_from_directory(os.path.join(root, 'uploads'), filename)
+# Stream the project as a YOLO dataset archive (images, labels, dataset.yaml)
+@app.route('/api/projects/uuid/<string:project_uuid>/export', methods=['GET'])
+@token_required
+def api_project_export(project_uuid):
+    user_id = request.current_user['id']
+    
+    project = g_projects.get_project_by_uuid(project_uuid, user_id)
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+    
+    fmt = request.args.get('format', 'zip')
+    if fmt not in ARCHIVE_FORMATS:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    
+    # Streamed straight from the uploads, nothing is written to exports/
+    exporter = DatasetExporter(project_uuid, root=root, user_id=user_id)
+    filename = secure_filename(f"{project['name']}.{fmt}") or f"{project_uuid}.{fmt}"
+    
+    return Response(
+        exporter.stream_archive(fmt),
+        mimetype='application/zip' if fmt == 'zip' else 'application/x-tar',
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
-# Secure endpoint to get image data with authentication
-@app.route('/api/images/<path:filename>')
-def get_image_data(filename):
-    # Check for token in query parameter
-    token = request.args.get('token')
+# Background jobs
+@app.route('/api/jobs', methods=['POST'])
+@token_required
+def api_jobs_submit():
+    user_id = request.current_user['id']
+    data = request.get_json()
+    if not data or 'type' not in data:
+        return jsonify({"error": "Job type is required"}), 400
+    
+    if data['type'] == 'export':
+        project_uuid = data.get('project_uuid')
+        if not project_uuid or not g_projects.get_project_by_uuid(project_uuid, user_id):
+            return jsonify({"error": "Project not found"}), 404
+        job, error = g_jobs.submit_export(project_uuid, user_id, bool(data.get('incremental', False)))
+    else:
+        return jsonify({"error": f"Job type can't be submitted directly: {data['type']}"}), 400
+    
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify(job), 202
+
+@app.route('/api/jobs', methods=['GET'])
+@token_required
+def api_jobs_get():
+    user_id = request.current_user['id']
+    status = request.args.get('status')
+    return jsonify(g_jobs.get_jobs(user_id, status.split(',') if status else None)), 200
+
+@app.route('/api/jobs/<string:job_uuid>', methods=['GET'])
+@token_required
+def api_job_get(job_uuid):
+    user_id = request.current_user['id']
+    job = g_jobs.get_job(job_uuid, user_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+@app.route('/api/jobs/<string:job_uuid>/cancel', methods=['POST'])
+@token_required
+def api_job_cancel(job_uuid):
+    user_id = request.current_user['id']
+    job, error = g_jobs.cancel_job(job_uuid, user_id)
+    if error:
+        return jsonify({"error": error}), 404 if error == "Job not found" else 409
+    return jsonify(job), 200
+
+# Serve uploaded files
+def media_access_error(filename):
+    """
+    None if the request may read uploads/<filename>, else an error response.
+    Accepts the signed ?expires=&signature= of the file's project, which keeps
+    URLs stable and cacheable, or a JWT in the header or the legacy ?token=.
+    """
+    signature = request.args.get('signature')
+    if signature:
+        project_uuid = filename.split('/', 1)[0]
+        if g_auth.verify_media(project_uuid, request.args.get('expires', type=int), signature):
+            return None
+        return jsonify({"error": "Invalid or expired media signature"}), 403
     
+    token = request.args.get('token')
     if not token:
-        # Fall back to Authorization header
         auth_header = request.headers.get('Authorization')
         if auth_header and auth_header.startswith('Bearer '):
             token = auth_header.split(' ')[1]
@@ -249,18 +617,62 @@ def get_image_data(filename):
     if not token:
         return jsonify({"error": "Authentication token is missing"}), 401
     
-    # Validate token
     result, status_code = g_auth.get_current_user(token)
     if status_code != 200:
         return jsonify(result), status_code
-    
-    # Check if file exists
-    file_path = os.path.join(root, 'uploads', filename)
-    if not os.path.exists(file_path):
+    return None
+
+def send_media(path, private=True):
+    """
+    Send an uploaded file with a strong ETag, Range support and immutable
+    caching. Uploads are named by uuid and never rewritten, so name and size
+    identify the content; a matching If-None-Match is answered without
+    opening the file.
+    """
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        stat = None
+    if not stat:
         return jsonify({"error": "File not found"}), 404
     
-    # Return the file with appropriate content type
-    return send_from_directory(os.path.join(root, 'uploads'), filename)
+    etag = f"{os.path.splitext(os.path.basename(path))[0]}-{stat.st_size:x}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+    else:
+        response = send_file(path, etag=etag, conditional=True, max_age=MEDIA_MAX_AGE)
+    
+    response.cache_control.max_age = MEDIA_MAX_AGE
+    response.cache_control.immutable = True
+    response.cache_control.public = not private
+    response.cache_control.private = private
+    return response
+
+@app.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    # Public access to uploaded files (no authentication required)
+    return send_media(safe_join(g_projects.upload_folder, filename), private=False)
+
+# Secure endpoint to get image data with authentication
+@app.route('/api/images/<path:filename>')
+def get_image_data(filename):
+    error = media_access_error(filename)
+    if error:
+        return error
+    return send_media(safe_join(g_projects.upload_folder, filename))
+
+# Thumbnails of uploaded images, e.g. /api/thumbnails/256/<project>/<file>
+@app.route('/api/thumbnails/<int:size>/<path:filename>')
+def get_thumbnail(size, filename):
+    error = media_access_error(filename)
+    if error:
+        return error
+    
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({"error": f"Thumbnail size must be one of {list(THUMBNAIL_SIZES)}"}), 400
+    
+    return send_media(g_projects.get_thumbnail(filename, size))
 
 # Label routes
 @app.route('/api/projects/<string:project_uuid>/labels', methods=['GET'])
@@ -300,6 +712,15 @@ def get_image_annotations(image_uuid):
         return jsonify({"error": error}), 404
     return jsonify(annotations), 200
 
+@app.route('/api/projects/<string:project_uuid>/annotations', methods=['GET'])
+@token_required
+def get_project_annotations(project_uuid):
+    user_id = request.current_user['id']
+    annotations, error = g_projects.get_project_annotations(project_uuid, user_id)
+    if error:
+        return jsonify({"error": error}), 404
+    return jsonify(annotations), 200
+
 @app.route('/api/images/<string:image_uuid>/annotations', methods=['POST'])
 @token_required
 def add_image_annotation(image_uuid):
@@ -327,5 +748,100 @@ def delete_image_annotation(image_uuid, annotation_id):
         return jsonify({"error": error}), 404
     return jsonify({"message": "Annotation deleted successfully"}), 200
 
+# Batch annotation writes: a whole frame (or several) in one transaction
+@app.route('/api/annotations/batch', methods=['POST'])
+@token_required
+def save_annotations_batch():
+    user_id = request.current_user['id']
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Request body is required"}), 400
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+        
+    create = data.get('create', [])
+    update = data.get('update', [])
+    delete = data.get('delete', [])
+    if not all(isinstance(v, list) for v in (create, update, delete)):
+        return jsonify({"error": "create, update and delete must be lists"}), 400
+        
+    annotations, error = g_projects.save_annotations(create, update, delete, user_id)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify(annotations), 200
+
+# Annotation import for images already in the project: a COCO JSON file, or
+# a ZIP/tar archive of YOLO label files (<image name>.txt, with classes.txt
+# or data.yaml for class names). Runs as a background job; send the file as
+# the raw body (?filename=instances.json) or as the 'file' field of a form.
+@app.route('/api/projects/uuid/<string:project_uuid>/annotations/import', methods=['POST'])
+@token_required
+def api_project_annotations_import(project_uuid):
+    user_id = request.current_user['id']
+    request.max_content_length = MAX_ARCHIVE_SIZE
+    
+    project = g_projects.get_project_by_uuid(project_uuid, user_id)
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+    
+    filename, stream, error = upload_stream()
+    if error:
+        return jsonify({"error": error}), 400
+    
+    if not allowed_file(filename, ALLOWED_ARCHIVE_EXTENSIONS | {'json'}):
+        return jsonify({"error": f"File type not allowed: {filename}"}), 400
+    
+    try:
+        file_path = g_projects.save_archive(project_uuid, stream, filename)
+    except ValueError:
+        return jsonify({"error": "Invalid multipart/form-data body"}), 400
+    job, error = g_jobs.submit_annotation_import(project_uuid, file_path, filename, user_id)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    return jsonify(job), 202
+
+@app.cli.command('import-annotations')
+@click.argument('project_uuid')
+@click.argument('path')
+def import_annotations(project_uuid, path):
+    """Import a COCO JSON file or an archive of YOLO labels into a project.
+    The file is imported in one transaction; running it again adds its boxes again."""
+    stats = DatasetImporter(project_uuid).import_file(path)
+    print(f"-> Imported {stats['annotations']} annotations with {stats['labels']} labels, "
+          f"{stats['invalid']} invalid, {stats['unmatched']} unmatched")
+
+@app.cli.command('backfill-dimensions')
+def backfill_dimensions():
+    """Store width/height of images uploaded before they were recorded"""
+    updated, unreadable = g_projects.backfill_image_dimensions()
+    print(f"-> Recorded dimensions of {updated} images, {unreadable} unreadable")
+
+@app.cli.command('dedupe-images')
+def dedupe_images():
+    """Move images uploaded before the blob store into it, sharing identical files"""
+    hashed, deduplicated, freed, missing = g_projects.deduplicate_images()
+    print(f"-> Hashed {hashed} images, {deduplicated} were duplicates ({freed / 1024 / 1024:.1f} MB freed), "
+          f"{missing} missing")
+
+@app.cli.command('expire-uploads')
+def expire_uploads():
+    """Delete resumable uploads abandoned for UPLOAD_EXPIRY_HOURS, with their staging files"""
+    expired = g_projects.expire_uploads()
+    print(f"-> Deleted {expired} expired uploads")
+
+@app.cli.command('recover-jobs')
+def recover_jobs():
+    """Fail interrupted jobs and run the queued ones, unless a server is running"""
+    if not g_jobs.recover_on_startup():
+        print("-> A server is running and has recovered the jobs already")
+        return
+    g_jobs.wait()
+    print("-> Recovered jobs")
+
 if __name__ == '__main__':
+    # With the reloader this module runs in two processes; only the child
+    # that serves requests recovers jobs, without waiting for a request
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        g_jobs.recover_on_startup()
     app.run(debug=True, host='0.0.0.0', port=1337)
\ No newline at end of file
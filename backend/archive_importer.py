@@ -0,0 +1,151 @@
+from typing import Callable, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+import os
+import posixpath
+import uuid
+try:
+    from database.models import *
+    from blob_store import BLOB_FOLDER, BlobStore
+    from dataset_importer import (CLASS_NAME_FILES, MAX_COCO_MEMBER_SIZE, MAX_TEXT_MEMBER_SIZE, TEXT_EXTENSIONS,
+                                  DatasetImporter, iter_archive, label_key, load_json_member, member_parts,
+                                  parse_class_names, phase_progress)
+    from proejcts import ALLOWED_EXTENSIONS, UPLOAD_FOLDER, UPLOAD_CHUNK_SIZE, UPLOAD_WORKERS, store_image
+    from thumbnails import remove_thumbnails
+except ImportError:
+    # Imported from the repository root (scripts, test.py)
+    from backend.database.models import *
+    from backend.blob_store import BLOB_FOLDER, BlobStore
+    from backend.dataset_importer import (CLASS_NAME_FILES, MAX_COCO_MEMBER_SIZE, MAX_TEXT_MEMBER_SIZE,
+                                          TEXT_EXTENSIONS, DatasetImporter, iter_archive, label_key,
+                                          load_json_member, member_parts, parse_class_names, phase_progress)
+    from backend.proejcts import ALLOWED_EXTENSIONS, UPLOAD_FOLDER, UPLOAD_CHUNK_SIZE, UPLOAD_WORKERS, store_image
+    from backend.thumbnails import remove_thumbnails
+DB_PATH = "db.sqlite"
+# Directory the stored image paths (uploads/...) are relative to
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Images registered per transaction
+IMPORT_BATCH_SIZE = 500
+
+class ArchiveImporter:
+    def __init__(self, project_uuid: str, root: str = ROOT, user_id=None):
+        self.database = DBSession(DB_PATH)
+        self.project_uuid = project_uuid
+        self.root = root
+        self.user_id = user_id
+        self.project_folder = os.path.join(root, UPLOAD_FOLDER, project_uuid)
+        self.blobs = BlobStore(os.path.join(root, UPLOAD_FOLDER, BLOB_FOLDER))
+
+    def import_archive(self, archive_path: str,
+                       progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Extract the images of a dataset archive into the project and import
+        its YOLO labels or COCO annotations. Members are streamed out of the
+        archive into the blob store one by one, probed and thumbnailed on a
+        thread pool and registered IMPORT_BATCH_SIZE at a time; annotations
+        are matched to the new images once the whole archive has been read,
+        so their order in the archive does not matter, and are imported in
+        one transaction.
+        Args:
+            archive_path: ZIP or tar archive on disk
+            progress: Called with (done, total) over reading the archive and
+                importing its annotations
+        Returns:
+            Dictionary with the number of images imported, of members that
+            were skipped, and the DatasetImporter stats
+        """
+        if not self.database.get_project_by_uuid(self.project_uuid, self.user_id):
+            raise ValueError(f"Project with UUID {self.project_uuid} not found")
+        os.makedirs(self.project_folder, exist_ok=True)
+
+        image_ids = {}    # label key -> image id
+        images = {}       # filename -> (image id, width, height), for COCO files
+        label_texts = {}  # label key -> YOLO label file
+        class_names = {}
+        coco_files = []
+        registered = skipped = 0
+        pending = []
+        archive_size = os.path.getsize(archive_path)
+        read_progress = phase_progress(progress, 0, 2)
+
+        with open(archive_path, 'rb') as f, ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+            try:
+                for name, member, member_size in iter_archive(f):
+                    parts = member_parts(name)
+                    extension = posixpath.splitext(parts[-1])[1].lower() if parts else ''
+                    if extension[1:] in ALLOWED_EXTENSIONS:
+                        pending.append(self._store_member(pool, parts, member, extension))
+                        if len(pending) >= IMPORT_BATCH_SIZE:
+                            registered += self._register(pending, image_ids, images)
+                            pending = []
+                    elif extension == '.json' and member_size <= MAX_COCO_MEMBER_SIZE:
+                        coco_files.append(load_json_member(parts, member))
+                    elif extension in TEXT_EXTENSIONS and member_size <= MAX_TEXT_MEMBER_SIZE:
+                        text = member.read().decode('utf-8', errors='replace')
+                        if extension == '.txt' and parts[-1] not in CLASS_NAME_FILES:
+                            label_texts[label_key(parts)] = text
+                        else:
+                            class_names = parse_class_names(parts[-1], text) or class_names
+                    else:
+                        skipped += 1
+                    if read_progress:
+                        read_progress(f.tell(), archive_size)
+                registered += self._register(pending, image_ids, images)
+                pending = []
+            except Exception:
+                self._discard(pending)
+                raise
+
+        importer = DatasetImporter(self.project_uuid, self.user_id)
+        importer.import_annotations(label_texts, class_names, coco_files, image_ids=image_ids, images=images,
+                                    progress=phase_progress(progress, 1, 2))
+        return {"images": registered, "skipped": skipped, **importer.stats}
+
+    def _store_member(self, pool, parts, member, extension):
+        """Copy one image out of the archive and hand it to the pool to finish"""
+        filename = f"{uuid.uuid4()}{extension}"
+        writer = self.blobs.writer()
+        try:
+            for chunk in iter(lambda: member.read(UPLOAD_CHUNK_SIZE), b""):
+                writer.write(chunk)
+        except Exception:
+            writer.abort()
+            raise
+        return parts, filename, pool.submit(store_image, writer, os.path.join(self.project_folder, filename))
+
+    def _register(self, pending, image_ids, images_by_name) -> int:
+        images = []
+        for parts, filename, future in pending:
+            content_hash, file_size, width, height = future.result()
+            images.append({
+                "uuid": os.path.splitext(filename)[0],
+                "original_filename": parts[-1],
+                "file_path": os.path.join(UPLOAD_FOLDER, self.project_uuid, filename),
+                "file_size": file_size,
+                "width": width,
+                "height": height,
+                "content_hash": content_hash
+            })
+        if not images:
+            return 0
+        rows = self.database.add_project_images(self.project_uuid, images, self.user_id)
+        if rows is None:
+            raise ValueError(f"Project with UUID {self.project_uuid} not found")
+        for (parts, _, _), row in zip(pending, rows):
+            image_ids[label_key(parts)] = row["id"]
+            images_by_name.setdefault(parts[-1], (row["id"], row["width"], row["height"]))
+        return len(rows)
+
+    def _discard(self, pending) -> None:
+        """Remove the files of images that were stored but not registered"""
+        content_hashes = []
+        for _, filename, future in pending:
+            # Waits for the file to be in place before removing it
+            if not future.cancelled() and not future.exception():
+                content_hashes.append(future.result()[0])
+            file_path = os.path.join(self.project_folder, filename)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            remove_thumbnails(file_path)
+        for content_hash in self.database.get_unreferenced_hashes(content_hashes):
+            self.blobs.release(content_hash)
@@ -2,10 +2,16 @@ from database.models import *
 from flask import session, jsonify
 import jwt
 import datetime
+import hashlib
+import hmac
+import time
 import os
 
 DB_PATH = "db.sqlite"
 SECRET_KEY = os.environ.get('SECRET_KEY', 'dev_secret_key')
+# Signed media URLs expire at the end of the next whole period, so the URL of
+# a file stays the same (and cacheable) for at least one period
+MEDIA_URL_TTL = int(os.environ.get('MEDIA_URL_TTL', 24 * 3600))
 
 class AuthController:
     def __init__(self) -> None:
@@ -101,4 +107,22 @@ class AuthController:
         }
         token = jwt.encode(payload, SECRET_KEY, algorithm='HS256')
         print(f"Generated token: {token[:20]}...")
-        return token 
\ No newline at end of file
+        return token
+    
+    def sign_media(self, project_uuid):
+        """
+        Query parameters granting read access to the files of one project,
+        so image URLs don't carry the JWT.
+        """
+        expires = (int(time.time()) // MEDIA_URL_TTL + 2) * MEDIA_URL_TTL
+        return {"expires": expires, "signature": self._media_signature(project_uuid, expires)}
+    
+    def verify_media(self, project_uuid, expires, signature):
+        if not expires or not signature or expires < time.time():
+            return False
+        return hmac.compare_digest(self._media_signature(project_uuid, expires), signature)
+    
+    @staticmethod
+    def _media_signature(project_uuid, expires):
+        message = f"{project_uuid}:{expires}".encode()
+        return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32] 
\ No newline at end of file
@@ -0,0 +1,146 @@
+import errno
+import hashlib
+import os
+import uuid
+from typing import Optional, Tuple
+
+# Content-addressed image store: uploads/blobs/<first 2 hex digits>/<sha256>.
+# Project files are hard links to their blob, so every existing path keeps
+# working and identical uploads share one copy on disk. The reference count
+# is the number of image rows with the blob's content_hash, not the link
+# count: exports hard link the same files and must not keep blobs alive.
+BLOB_FOLDER = "blobs"
+HASH_READ_SIZE = 1024 * 1024
+
+# Errors meaning "hard links aren't possible here"; files are then kept without dedup
+LINK_UNSUPPORTED = (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.EMLINK)
+
+class BlobWriter:
+    """Hashes data while writing it to a temp file inside the store"""
+    def __init__(self, store: "BlobStore"):
+        self.store = store
+        self.tmp_path = os.path.join(store.folder, ".tmp", f"{uuid.uuid4().hex}.part")
+        os.makedirs(os.path.dirname(self.tmp_path), exist_ok=True)
+        self._file = open(self.tmp_path, "wb")
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self, dest: str) -> str:
+        """Store the data as a blob and link it to dest, returns the content hash"""
+        self._file.close()
+        digest = self._hash.hexdigest()
+        self.store._link_new(self.tmp_path, digest, dest)
+        return digest
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+class BlobStore:
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.folder, digest[:2], digest)
+
+    def writer(self) -> BlobWriter:
+        return BlobWriter(self)
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def store_file(self, path: str, dest: str) -> str:
+        """
+        Move an already written file (a finished chunked upload, a video
+        frame) into the store and link it to dest. Returns the content hash.
+        """
+        digest = self.hash_file(path)
+        self._link_new(path, digest, dest)
+        return digest
+
+    def adopt(self, path: str) -> Tuple[str, bool]:
+        """
+        Put an existing project file under the store without moving it:
+        it becomes the blob if its content is new, or is atomically replaced
+        by a link to the blob holding the same content.
+        Returns (content hash, whether disk space was freed).
+        """
+        digest = self.hash_file(path)
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if not os.path.exists(blob):
+            try:
+                os.link(path, blob)
+                return digest, False
+            except FileExistsError:
+                pass
+            except OSError as e:
+                if e.errno not in LINK_UNSUPPORTED:
+                    raise
+                return digest, False
+        if os.path.samefile(path, blob):
+            return digest, False
+
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            os.link(blob, tmp_path)
+        except OSError as e:
+            if e.errno in LINK_UNSUPPORTED or e.errno == errno.ENOENT:
+                return digest, False
+            raise
+        os.replace(tmp_path, path)
+        return digest, True
+
+    def _link_new(self, src: str, digest: str, dest: str) -> None:
+        """
+        Make dest a link to the blob of digest; src holds the same content
+        and is consumed. New content is moved to dest first and the blob
+        linked to it, so the data always has a name even if the blob is
+        released concurrently.
+        """
+        blob = self.blob_path(digest)
+        try:
+            os.link(blob, dest)
+            os.remove(src)
+            return
+        except FileNotFoundError:
+            pass  # New content, or its blob was just released
+        except OSError as e:
+            if e.errno not in LINK_UNSUPPORTED:
+                raise
+
+        os.replace(src, dest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(dest, blob)
+        except FileExistsError:
+            pass  # Stored concurrently by another upload; this copy stays separate
+        except OSError as e:
+            # No dedup on this filesystem, but the upload still succeeds
+            if e.errno not in LINK_UNSUPPORTED:
+                raise
+
+    def release(self, digest: Optional[str]) -> bool:
+        """
+        Remove the blob of digest. Call once no image row references it any
+        more; files still linked to it (exports) keep their data.
+        Returns True if it was removed.
+        """
+        if not digest:
+            return False
+        try:
+            os.remove(self.blob_path(digest))
+            return True
+        except FileNotFoundError:
+            return False
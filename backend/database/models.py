@@ -1,13 +1,29 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Boolean, DateTime, Float
+from sqlalchemy import create_engine, event, exists, insert, inspect, text, Column, Integer, String, ForeignKey, Boolean, DateTime, Float
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship
 from werkzeug.security import generate_password_hash, check_password_hash
 
 import atexit
+import json
+import math
+import threading
 import uuid
 import datetime
 import os
 
+# Connection pool settings, shared by every DBSession in the process
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 3600))
+
+# SQLite tuning applied to every new connection
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 64 * 1024))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+
 # Create a base class for declarative class definitions
 Base = declarative_base()
 
@@ -39,7 +55,7 @@ class Projects(Base):
     __tablename__ = 'projects'
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
-    uuid = Column(String, nullable=False)
+    uuid = Column(String, nullable=False, unique=True, index=True)
     description = Column(String)
     resources = Column(Integer, nullable=False)
     date_updated = Column(String, nullable=False)
@@ -53,13 +69,18 @@ class Projects(Base):
 class ProjectImage(Base):
     __tablename__ = 'project_images'
     id = Column(Integer, primary_key=True)
-    uuid = Column(String, nullable=False)
+    uuid = Column(String, nullable=False, unique=True, index=True)
     original_filename = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
+    # Pixel size as displayed, read from the file header at upload time
+    width = Column(Integer)
+    height = Column(Integer)
+    # SHA-256 of the file, names its blob in the content-addressed store
+    content_hash = Column(String(64), index=True)
     upload_date = Column(String, nullable=False)
     # Add project relationship
-    project_id = Column(Integer, ForeignKey('projects.id'))
+    project_id = Column(Integer, ForeignKey('projects.id'), index=True)
     project = relationship("Projects", back_populates="images")
     # Add user relationship
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -71,7 +92,7 @@ class Label(Base):
     __tablename__ = 'labels'
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
-    project_id = Column(Integer, ForeignKey('projects.id'))
+    project_id = Column(Integer, ForeignKey('projects.id'), index=True)
     project = relationship("Projects", backref="labels")
     created_at = Column(String, default=lambda: str(datetime.datetime.now()))
     # Add relationship to annotations
@@ -86,24 +107,185 @@ class Annotation(Base):
     height = Column(Float, nullable=False)
     created_at = Column(String, default=lambda: str(datetime.datetime.now()))
     # Add relationships
-    image_id = Column(Integer, ForeignKey('project_images.id'))
+    image_id = Column(Integer, ForeignKey('project_images.id'), index=True)
     image = relationship("ProjectImage", back_populates="annotations")
     label_id = Column(Integer, ForeignKey('labels.id'))
     label = relationship("Label", back_populates="annotations")
 
-# -----------------------------------------------------------------------------
+class Job(Base):
+    __tablename__ = 'jobs'
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String, nullable=False, unique=True, index=True)
+    type = Column(String, nullable=False)
+    # queued -> running -> completed | failed | cancelled
+    status = Column(String, nullable=False, default='queued', index=True)
+    progress = Column(Float, nullable=False, default=0.0)
+    # JSON encoded job arguments and outcome
+    params = Column(String, nullable=False, default='{}')
+    result = Column(String)
+    error = Column(String)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    project_uuid = Column(String)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    created_at = Column(String, default=lambda: str(datetime.datetime.now()))
+    started_at = Column(String)
+    finished_at = Column(String)
     
+    def to_dict(self):
+        return {
+            "uuid": self.uuid,
+            "type": self.type,
+            "status": self.status,
+            "progress": self.progress,
+            "params": json.loads(self.params or '{}'),
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "cancel_requested": self.cancel_requested,
+            "project_uuid": self.project_uuid,
+            "user_id": self.user_id,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class Upload(Base):
+    __tablename__ = 'uploads'
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String, nullable=False, unique=True, index=True)
+    project_uuid = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    filename = Column(String, nullable=False)
+    # What the file becomes when completed: image, video
+    kind = Column(String, nullable=False, default='image')
+    size = Column(Integer, nullable=False)
+    # uploading -> completing -> completed, or failed if completion lost the data.
+    # Uploads never completed are deleted by ProjectsController.expire_uploads()
+    status = Column(String, nullable=False, default='uploading')
+    result = Column(String)
+    created_at = Column(String, default=lambda: str(datetime.datetime.now()))
+    completed_at = Column(String)
+    
+    def to_dict(self):
+        return {
+            "uuid": self.uuid,
+            "project_uuid": self.project_uuid,
+            "user_id": self.user_id,
+            "filename": self.filename,
+            "kind": self.kind,
+            "size": self.size,
+            "status": self.status,
+            "result": json.loads(self.result) if self.result else None,
+            "created_at": self.created_at,
+            "completed_at": self.completed_at
+        }
+
+# -----------------------------------------------------------------------------
+# Engine registry: one engine and one thread-local session registry per
+# database file, shared by all controllers of the process
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while an annotation write is in flight;
+    # NORMAL is durable across application crashes in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    # Negative value is interpreted by SQLite as KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def upgrade_schema(engine):
+    """
+    Bring an existing database file up to date with the declared schema.
+    create_all() only creates missing tables, so nullable columns and
+    indexes added to tables that already exist are created here.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            except OperationalError:
+                # Another worker process starting up may have added it first
+                if column.name not in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+                    raise
+                continue
+            print(f"-> Added column {table.name}.{column.name}")
+            
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                # e.g. duplicate values in a column that is now unique
+                print(f"-> Can't create index {index.name}: {e}")
+
+def get_engine(db_path):
+    db_path = os.path.abspath(db_path)
+    with _engines_lock:
+        if db_path not in _engines:
+            engine = create_engine(
+                f'sqlite:///{db_path}',
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=True,
+                # Pooled connections are handed to whichever request thread
+                # checks them out, so disable sqlite3's same-thread guard
+                connect_args={"check_same_thread": False}
+            )
+            event.listen(engine, "connect", _set_sqlite_pragmas)
+            Base.metadata.create_all(engine)
+            upgrade_schema(engine)
+            _engines[db_path] = (engine, scoped_session(sessionmaker(bind=engine)))
+        return _engines[db_path]
+
+def remove_sessions():
+    """Close the current thread's sessions, called at the end of every request"""
+    for _, Session in list(_engines.values()):
+        Session.remove()
+
+def dispose_engines():
+    for engine, Session in list(_engines.values()):
+        Session.remove()
+        engine.dispose()
+
+def _reset_engines_after_fork():
+    # Connections must not be shared across fork() (gunicorn workers, job
+    # processes): the child drops the inherited pool and opens its own
+    # connections on first use. The lock may have been held by another thread.
+    global _engines_lock
+    _engines_lock = threading.Lock()
+    for engine, Session in list(_engines.values()):
+        # Forget (without closing) the forking thread's session
+        Session.registry.clear()
+        engine.dispose(close=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_engines_after_fork)
+
+atexit.register(dispose_engines)
+
 class DBSession:
     def __init__(self, db_path) -> None:
-        self.engine = create_engine(f'sqlite:///{db_path}')
-        Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
-        
-        atexit.register(self.destuctor)
-        
+        self.engine, self.Session = get_engine(db_path)
+
+    @property
+    def session(self):
+        # Thread-local session, created on first use in the current request
+        return self.Session()
+
     def destuctor(self):
-        self.session.close()
+        self.Session.remove()
         
 # -----------------------------------------------------------------------------
 # User methods
@@ -208,6 +390,10 @@ class DBSession:
         }
         
     def get_project_by_uuid(self, project_uuid, user_id=None):
+        """
+        Project row only: one indexed lookup, cheap enough for existence and
+        ownership checks. Use get_project_with_images for the image list.
+        """
         query = self.session.query(Projects).filter_by(uuid=project_uuid)
         
         if user_id:
@@ -218,20 +404,6 @@ class DBSession:
         if not project:
             return None
             
-        # Convert project images to dict
-        images = []
-        for image in project.images:
-            images.append({
-                "id": image.id,
-                "uuid": image.uuid,
-                "original_filename": image.original_filename,
-                "file_path": image.file_path,
-                "file_size": image.file_size,
-                "upload_date": image.upload_date,
-                "project_id": image.project_id,
-                "user_id": image.user_id
-            })
-            
         return {
             "id": project.id,
             "uuid": project.uuid,
@@ -240,11 +412,27 @@ class DBSession:
             "resources": project.resources,
             "date_updated": project.date_updated,
             "type": project.type if hasattr(project, 'type') else "object-detection",
-            "user_id": project.user_id,
-            "images": images
+            "user_id": project.user_id
         }
         
+    def get_project_with_images(self, project_uuid, user_id=None):
+        project = self.get_project_by_uuid(project_uuid, user_id)
+        
+        if not project:
+            return None
+            
+        images = self.session.query(ProjectImage).filter(
+            ProjectImage.project_id == project["id"]
+        ).order_by(ProjectImage.id).all()
+        project["images"] = [self._image_to_dict(image) for image in images]
+        
+        return project
+        
     def delete_project_by_uuid(self, project_uuid, user_id=None):
+        """
+        Delete a project with its images.
+        Returns (deleted, content hashes no image references any more).
+        """
         query = self.session.query(Projects).filter_by(uuid=project_uuid)
         
         if user_id:
@@ -253,13 +441,17 @@ class DBSession:
         project = query.first()
         
         if not project:
-            return False
+            return False, []
             
+        content_hashes = self.get_project_content_hashes(project_uuid)
         self.session.delete(project)
+        self.session.flush()
+        orphaned = self.get_unreferenced_hashes(content_hashes)
         self.session.commit()
-        return True
+        return True, orphaned
 
-    def add_project_image(self, project_uuid, original_filename, file_path, file_size, user_id=None):
+    def add_project_image(self, project_uuid, original_filename, file_path, file_size, user_id=None,
+                          width=None, height=None, content_hash=None):
         # Get project by UUID
         project = self.session.query(Projects).filter_by(uuid=project_uuid).first()
         
@@ -272,6 +464,9 @@ class DBSession:
             original_filename=original_filename,
             file_path=file_path,
             file_size=file_size,
+            width=width,
+            height=height,
+            content_hash=content_hash,
             upload_date=str(datetime.datetime.now()),
             project_id=project.id
         )
@@ -286,46 +481,176 @@ class DBSession:
         self.session.add(image)
         self.session.commit()
         
+        return self._image_to_dict(image)
+        
+    def add_project_images(self, project_uuid, images, user_id=None):
+        """
+        Register many images in one transaction with a single resources update.
+        images: [{"original_filename", "file_path", "file_size",
+                  optional "uuid", "width", "height", "content_hash"}]
+        """
+        project = self.session.query(Projects).filter_by(uuid=project_uuid).first()
+        
+        if not project:
+            return None
+            
+        upload_date = str(datetime.datetime.now())
+        rows = []
+        for data in images:
+            image = ProjectImage(
+                uuid=data.get("uuid") or str(uuid.uuid4()),
+                original_filename=data["original_filename"],
+                file_path=data["file_path"],
+                file_size=data["file_size"],
+                width=data.get("width"),
+                height=data.get("height"),
+                content_hash=data.get("content_hash"),
+                upload_date=upload_date,
+                project_id=project.id
+            )
+            if user_id:
+                image.user_id = user_id
+            rows.append(image)
+            
+        project.resources += len(rows)
+        project.date_updated = upload_date
+        
+        self.session.add_all(rows)
+        self.session.commit()
+        
+        return [self._image_to_dict(image) for image in rows]
+        
+    def get_project_images(self, project_uuid, user_id=None, limit=None, after=None,
+                           order="asc", annotated=None, label_id=None):
+        """
+        List project images, optionally as one keyset page.
+        Images are ordered by id; `after` is the id of the last image of the
+        previous page, so every page is a single index range scan no matter
+        how deep into the project it is.
+        Filters: annotated (True/False) and label_id (has a box with label).
+        """
+        # Get project by UUID
+        project_query = self.session.query(Projects.id).filter_by(uuid=project_uuid)
+        
+        if user_id:
+            project_query = project_query.filter_by(user_id=user_id)
+            
+        project = project_query.first()
+        
+        if not project:
+            return []
+            
+        query = self.session.query(ProjectImage).filter(ProjectImage.project_id == project.id)
+        
+        if annotated is not None:
+            has_annotations = exists().where(Annotation.image_id == ProjectImage.id)
+            query = query.filter(has_annotations if annotated else ~has_annotations)
+            
+        if label_id is not None:
+            query = query.filter(exists().where(
+                Annotation.image_id == ProjectImage.id,
+                Annotation.label_id == label_id
+            ))
+            
+        if order == "desc":
+            if after is not None:
+                query = query.filter(ProjectImage.id < after)
+            query = query.order_by(ProjectImage.id.desc())
+        else:
+            if after is not None:
+                query = query.filter(ProjectImage.id > after)
+            query = query.order_by(ProjectImage.id.asc())
+            
+        if limit is not None:
+            query = query.limit(limit)
+        
+        return [self._image_to_dict(image) for image in query]
+
+    @staticmethod
+    def _image_to_dict(image):
         return {
             "id": image.id,
             "uuid": image.uuid,
             "original_filename": image.original_filename,
             "file_path": image.file_path,
             "file_size": image.file_size,
+            "width": image.width,
+            "height": image.height,
+            "content_hash": image.content_hash,
             "upload_date": image.upload_date,
             "project_id": image.project_id,
             "user_id": image.user_id
         }
         
-    def get_project_images(self, project_uuid, user_id=None):
-        # Get project by UUID
-        project_query = self.session.query(Projects).filter_by(uuid=project_uuid)
+    def get_project_image_index(self, project_uuid):
+        """
+        Original filename -> (id, width, height) of every image of a project,
+        for matching imported annotations. The oldest image wins when a
+        filename was uploaded more than once.
+        """
+        rows = self.session.query(
+            ProjectImage.id, ProjectImage.original_filename, ProjectImage.width, ProjectImage.height
+        ).join(Projects).filter(Projects.uuid == project_uuid).order_by(ProjectImage.id.desc())
+        return {row.original_filename: (row.id, row.width, row.height) for row in rows}
         
-        if user_id:
-            project_query = project_query.filter_by(user_id=user_id)
-            
-        project = project_query.first()
+    def get_images_without_hash(self, after=0, limit=500):
+        """Next page (by id) of images stored before the blob store existed"""
+        rows = self.session.query(ProjectImage.id, ProjectImage.file_path).filter(
+            ProjectImage.id > after,
+            ProjectImage.content_hash == None
+        ).order_by(ProjectImage.id.asc()).limit(limit).all()
+        return [{"id": row.id, "file_path": row.file_path} for row in rows]
         
-        if not project:
+    def set_image_hashes(self, hashes):
+        """
+        Store content hashes in one transaction.
+        hashes: [{"id", "content_hash"}]
+        """
+        if hashes:
+            self.session.bulk_update_mappings(ProjectImage, hashes)
+            self.session.commit()
+        return len(hashes)
+        
+    def get_project_content_hashes(self, project_uuid):
+        """Distinct content hashes of a project's images"""
+        rows = self.session.query(ProjectImage.content_hash).join(Projects).filter(
+            Projects.uuid == project_uuid,
+            ProjectImage.content_hash != None
+        ).distinct()
+        return [row.content_hash for row in rows]
+        
+    def get_unreferenced_hashes(self, content_hashes):
+        """
+        Content hashes no image row references, i.e. blobs that can go.
+        Called inside delete transactions, so the count sees the deletes.
+        """
+        content_hashes = set(filter(None, content_hashes))
+        if not content_hashes:
             return []
-            
-        # Get all images for the project
-        images = self.session.query(ProjectImage).filter_by(project_id=project.id).all()
+        referenced = {
+            row.content_hash for row in self.session.query(ProjectImage.content_hash).filter(
+                ProjectImage.content_hash.in_(content_hashes)
+            ).distinct()
+        }
+        return sorted(content_hashes - referenced)
         
-        result = []
-        for image in images:
-            result.append({
-                "id": image.id,
-                "uuid": image.uuid,
-                "original_filename": image.original_filename,
-                "file_path": image.file_path,
-                "file_size": image.file_size,
-                "upload_date": image.upload_date,
-                "project_id": image.project_id,
-                "user_id": image.user_id
-            })
-            
-        return result
+    def get_images_without_dimensions(self, after=0, limit=500):
+        """Next page (by id) of images whose width/height were never recorded"""
+        rows = self.session.query(ProjectImage.id, ProjectImage.file_path).filter(
+            ProjectImage.id > after,
+            (ProjectImage.width == None) | (ProjectImage.height == None)
+        ).order_by(ProjectImage.id.asc()).limit(limit).all()
+        return [{"id": row.id, "file_path": row.file_path} for row in rows]
+        
+    def set_image_dimensions(self, dimensions):
+        """
+        Store image sizes in one transaction.
+        dimensions: [{"id", "width", "height"}]
+        """
+        if dimensions:
+            self.session.bulk_update_mappings(ProjectImage, dimensions)
+            self.session.commit()
+        return len(dimensions)
         
     def get_image_by_uuid(self, image_uuid, user_id=None):
         # Get image by UUID
@@ -346,6 +671,9 @@ class DBSession:
             "original_filename": image.original_filename,
             "file_path": image.file_path,
             "file_size": image.file_size,
+            "width": image.width,
+            "height": image.height,
+            "content_hash": image.content_hash,
             "upload_date": image.upload_date,
             "project_id": image.project_id,
             "project_uuid": image.project.uuid,
@@ -353,6 +681,7 @@ class DBSession:
         }
         
     def delete_image(self, image_uuid, user_id=None):
+        """Returns (deleted, content hashes no image references any more)"""
         # Get image by UUID
         query = self.session.query(ProjectImage).filter_by(uuid=image_uuid)
         
@@ -363,13 +692,15 @@ class DBSession:
         image = query.first()
         
         if not image:
-            return False
+            return False, []
             
         # Get project to update resources count
         project = image.project
         
         # Delete the image
         self.session.delete(image)
+        self.session.flush()
+        orphaned = self.get_unreferenced_hashes([image.content_hash])
         
         # Update project resources count and date_updated
         if project.resources > 0:
@@ -377,13 +708,15 @@ class DBSession:
         project.date_updated = str(datetime.datetime.now())
         
         self.session.commit()
-        return True
+        return True, orphaned
         
     def update_project_resources_count(self, project_uuid):
         # Get project by UUID
         project = self.session.query(Projects).filter(Projects.uuid == project_uuid).first()
         if project:
-            project.resources = len(project.images)
+            project.resources = self.session.query(ProjectImage).filter(
+                ProjectImage.project_id == project.id
+            ).count()
             project.date_updated = str(datetime.datetime.now())
             self.session.commit()
             return True
@@ -448,6 +781,35 @@ class DBSession:
         self.session.commit()
         return True, None
 
+    def get_or_create_labels(self, project_uuid, names, commit=True):
+        """
+        Resolve label names of a project to ids, creating the missing labels
+        in one transaction. With commit=False they are only flushed, for
+        callers that commit the surrounding transaction themselves.
+        Returns ({name: id}, error).
+        """
+        project = self.session.query(Projects).filter(Projects.uuid == project_uuid).first()
+        if not project:
+            return None, "Project not found"
+        
+        names = set(names)
+        ids = {
+            label.name: label.id
+            for label in self.session.query(Label).filter(
+                Label.project_id == project.id,
+                Label.name.in_(names)
+            )
+        } if names else {}
+        new_labels = [Label(name=name, project_id=project.id) for name in sorted(names - ids.keys())]
+        if new_labels:
+            self.session.add_all(new_labels)
+            if commit:
+                self.session.commit()
+            else:
+                self.session.flush()
+            ids.update((label.name, label.id) for label in new_labels)
+        return ids, None
+
     # Annotation methods
     def add_annotation(self, image_uuid, label_id, x, y, width, height, user_id=None):
         # Get image by UUID
@@ -455,10 +817,12 @@ class DBSession:
         if not image:
             return None, "Image not found"
             
-        # Get label
+        # Get label, which must be one of the image's project
         label = self.session.query(Label).filter(Label.id == label_id).first()
         if not label:
             return None, "Label not found"
+        if label.project_id != image.project_id:
+            return None, "Label does not belong to the image's project"
             
         # Create new annotation
         annotation = Annotation(
@@ -485,25 +849,226 @@ class DBSession:
             "created_at": annotation.created_at
         }, None
         
+    def save_annotations(self, create=(), update=(), delete=(), user_id=None):
+        """
+        Apply many annotation changes in a single transaction.
+        create: [{"image_uuid", "label_id", "x", "y", "width", "height"}]
+        update: [{"id", and any of "label_id", "x", "y", "width", "height"}]
+        delete: [annotation_id, ...]
+        Returns the resulting annotations of every touched image, grouped by
+        image uuid. Nothing is written if any change is invalid.
+        """
+        session = self.session
+        fields = ("x", "y", "width", "height")
+        
+        # Normalize the payload first: ids become ints and coordinates floats,
+        # so malformed input is an error message rather than a TypeError
+        if not all(isinstance(item, dict) for item in list(create) + list(update)):
+            return None, "create and update items must be objects"
+        
+        checked_create = []
+        for item in create:
+            missing = [k for k in ("image_uuid", "label_id") + fields if k not in item]
+            if missing:
+                return None, f"Missing required fields: {', '.join(missing)}"
+            if not isinstance(item["image_uuid"], str):
+                return None, f"Invalid image_uuid: {item['image_uuid']!r}"
+            checked, error = self._check_annotation_fields(item, fields)
+            if error:
+                return None, error
+            checked_create.append(dict(checked, image_uuid=item["image_uuid"]))
+        
+        checked_update = []
+        for item in update:
+            if "id" not in item:
+                return None, "Missing annotation id in update"
+            annotation_id = self._as_id(item["id"])
+            if annotation_id is None:
+                return None, f"Invalid annotation id: {item['id']!r}"
+            checked, error = self._check_annotation_fields(item, fields)
+            if error:
+                return None, error
+            checked_update.append(dict(checked, id=annotation_id))
+        
+        checked_delete = [self._as_id(annotation_id) for annotation_id in delete]
+        if None in checked_delete:
+            return None, f"Invalid annotation id: {delete[checked_delete.index(None)]!r}"
+        create, update, delete = checked_create, checked_update, checked_delete
+            
+        # Existing annotations touched by update/delete, with their images
+        annotation_ids = {item["id"] for item in update} | set(delete)
+        existing = {}
+        if annotation_ids:
+            query = session.query(Annotation, ProjectImage).join(
+                ProjectImage, Annotation.image_id == ProjectImage.id
+            ).filter(Annotation.id.in_(annotation_ids))
+            if user_id:
+                query = query.join(Projects, ProjectImage.project_id == Projects.id).filter(
+                    Projects.user_id == user_id
+                )
+            existing = {annotation.id: (annotation, image) for annotation, image in query}
+            missing = annotation_ids - existing.keys()
+            if missing:
+                return None, f"Annotation not found: {sorted(missing)[0]}"
+        
+        # Images referenced by creates, resolved with one IN query
+        images = {image.uuid: image for _, image in existing.values()}
+        image_uuids = {item["image_uuid"] for item in create} - images.keys()
+        if image_uuids:
+            query = session.query(ProjectImage).filter(ProjectImage.uuid.in_(image_uuids))
+            if user_id:
+                query = query.join(Projects).filter(Projects.user_id == user_id)
+            images.update((image.uuid, image) for image in query)
+            missing = image_uuids - images.keys()
+            if missing:
+                return None, f"Image not found: {sorted(missing)[0]}"
+        
+        # Labels, also one IN query; a label must belong to the image's project
+        label_ids = {item["label_id"] for item in list(create) + list(update) if "label_id" in item}
+        labels = {}
+        if label_ids:
+            labels = {
+                label.id: label.project_id
+                for label in session.query(Label).filter(Label.id.in_(label_ids))
+            }
+            missing = label_ids - labels.keys()
+            if missing:
+                return None, f"Label not found: {sorted(missing)[0]}"
+        
+        try:
+            touched_image_ids = set()
+            
+            for item in create:
+                image = images[item["image_uuid"]]
+                if labels[item["label_id"]] != image.project_id:
+                    raise ValueError(f"Label {item['label_id']} does not belong to the image's project")
+                session.add(Annotation(
+                    image_id=image.id,
+                    label_id=item["label_id"],
+                    **{k: float(item[k]) for k in fields}
+                ))
+                touched_image_ids.add(image.id)
+                
+            for item in update:
+                annotation, image = existing[item["id"]]
+                if "label_id" in item:
+                    if labels[item["label_id"]] != image.project_id:
+                        raise ValueError(f"Label {item['label_id']} does not belong to the image's project")
+                    annotation.label_id = item["label_id"]
+                for k in fields:
+                    if k in item:
+                        setattr(annotation, k, float(item[k]))
+                touched_image_ids.add(image.id)
+                
+            if delete:
+                session.query(Annotation).filter(
+                    Annotation.id.in_(set(delete))
+                ).delete(synchronize_session=False)
+                touched_image_ids.update(existing[i][1].id for i in delete)
+                
+            session.commit()
+        except (ValueError, TypeError) as e:
+            session.rollback()
+            return None, str(e)
+        
+        return self._annotations_by_image(ProjectImage.id.in_(touched_image_ids)), None
+
+    def add_annotations_bulk(self, annotations, commit=True):
+        """
+        Insert many trusted annotations with one executemany, for imports.
+        annotations: [{"image_id", "label_id", "x", "y", "width", "height"}]
+        With commit=False the rows stay in the caller's transaction.
+        Returns the number of rows inserted.
+        """
+        if annotations:
+            # Core insert on the table: no ORM bookkeeping per row
+            created_at = str(datetime.datetime.now())
+            self.session.execute(insert(Annotation.__table__),
+                                 [dict(row, created_at=created_at) for row in annotations])
+            if commit:
+                self.session.commit()
+        return len(annotations)
+
+    @staticmethod
+    def _as_id(value):
+        """Ids arrive as JSON: ints and digit strings are accepted, nothing else"""
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str) and value.strip().isdigit():
+            return int(value)
+        return None
+
+    def _check_annotation_fields(self, item, fields):
+        """label_id and coordinates present in item, converted. Returns (values, error)"""
+        values = {}
+        if "label_id" in item:
+            values["label_id"] = self._as_id(item["label_id"])
+            if values["label_id"] is None:
+                return None, f"Invalid label_id: {item['label_id']!r}"
+        for k in fields:
+            if k not in item:
+                continue
+            try:
+                if isinstance(item[k], bool):
+                    raise TypeError()
+                values[k] = float(item[k])
+            except (TypeError, ValueError):
+                return None, f"Invalid {k}: {item[k]!r}"
+            if not math.isfinite(values[k]):
+                return None, f"Invalid {k}: {item[k]!r}"
+        return values, None
+
+    def _annotations_by_image(self, *criteria):
+        """
+        Annotations with their labels for every image matching criteria,
+        grouped by image uuid, in one joined query. Images without
+        annotations map to an empty list.
+        """
+        result = {}
+        rows = self.session.query(ProjectImage.uuid, Annotation, Label).outerjoin(
+            Annotation, Annotation.image_id == ProjectImage.id
+        ).outerjoin(
+            Label, Annotation.label_id == Label.id
+        ).filter(*criteria).order_by(ProjectImage.id, Annotation.id)
+        
+        for image_uuid, annotation, label in rows:
+            result.setdefault(image_uuid, [])
+            if annotation is None:
+                continue
+            result[image_uuid].append({
+                "id": annotation.id,
+                "x": annotation.x,
+                "y": annotation.y,
+                "width": annotation.width,
+                "height": annotation.height,
+                "label": {
+                    "id": label.id,
+                    "name": label.name
+                },
+                "created_at": annotation.created_at
+            })
+        return result
+        
     def get_image_annotations(self, image_uuid, user_id=None):
-        # Get image by UUID
-        image = self.session.query(ProjectImage).filter(ProjectImage.uuid == image_uuid).first()
-        if not image:
+        criteria = [ProjectImage.uuid == image_uuid]
+        if user_id:
+            criteria.append(ProjectImage.project.has(Projects.user_id == user_id))
+            
+        annotations = self._annotations_by_image(*criteria)
+        if image_uuid not in annotations:
             return None, "Image not found"
             
-        annotations = self.session.query(Annotation).filter(Annotation.image_id == image.id).all()
-        return [{
-            "id": annotation.id,
-            "x": annotation.x,
-            "y": annotation.y,
-            "width": annotation.width,
-            "height": annotation.height,
-            "label": {
-                "id": annotation.label.id,
-                "name": annotation.label.name
-            },
-            "created_at": annotation.created_at
-        } for annotation in annotations], None
+        return annotations[image_uuid], None
+        
+    def get_project_annotations(self, project_uuid, user_id=None):
+        """All annotations of a project grouped by image uuid, in one query"""
+        project = self.get_project_by_uuid(project_uuid, user_id)
+        if not project:
+            return None, "Project not found"
+            
+        return self._annotations_by_image(ProjectImage.project_id == project["id"]), None
         
     def delete_annotation(self, image_uuid, annotation_id, user_id=None):
         # Get image by UUID
@@ -525,3 +1090,153 @@ class DBSession:
         return True, None
 
 # -----------------------------------------------------------------------------
+# Job methods
+    def add_job(self, job_type, params, project_uuid=None, user_id=None):
+        job = Job(
+            uuid=str(uuid.uuid4()),
+            type=job_type,
+            status='queued',
+            progress=0.0,
+            params=json.dumps(params),
+            project_uuid=project_uuid,
+            user_id=user_id
+        )
+        self.session.add(job)
+        self.session.commit()
+        return job.to_dict()
+        
+    def get_job(self, job_uuid, user_id=None):
+        query = self.session.query(Job).filter_by(uuid=job_uuid)
+        
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+            
+        job = query.first()
+        return job.to_dict() if job else None
+        
+    def get_jobs(self, user_id=None, status=None, limit=100):
+        query = self.session.query(Job)
+        
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+        if status:
+            query = query.filter(Job.status.in_(status))
+            
+        return [job.to_dict() for job in query.order_by(Job.id.desc()).limit(limit)]
+        
+    def update_job(self, job_uuid, **fields):
+        """Update job columns; result is JSON encoded. Returns the job or None"""
+        job = self.session.query(Job).filter_by(uuid=job_uuid).first()
+        if not job:
+            return None
+            
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        for key, value in fields.items():
+            setattr(job, key, value)
+            
+        self.session.commit()
+        return job.to_dict()
+        
+    def request_job_cancel(self, job_uuid, user_id=None):
+        """
+        Flag a job for cancellation. Queued jobs are cancelled immediately,
+        running ones stop at their next progress report.
+        """
+        query = self.session.query(Job).filter_by(uuid=job_uuid)
+        
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+            
+        job = query.first()
+        if not job:
+            return None, "Job not found"
+        if job.status not in ('queued', 'running'):
+            return None, f"Job is already {job.status}"
+            
+        # Conditional, so a worker claiming the job at the same moment either
+        # never starts it or gets cancel_requested
+        cancelled = self.session.query(Job).filter_by(uuid=job.uuid, status='queued').update({
+            "status": "cancelled",
+            "cancel_requested": True,
+            "finished_at": str(datetime.datetime.now())
+        })
+        if not cancelled:
+            self.session.query(Job).filter_by(uuid=job.uuid).update({"cancel_requested": True})
+            
+        self.session.commit()
+        return job.to_dict(), None
+        
+    def claim_job(self, job_uuid):
+        """
+        Move a job from 'queued' to 'running' in one UPDATE, so a job that
+        was cancelled (or picked up elsewhere) meanwhile is never started.
+        """
+        claimed = self.session.query(Job).filter_by(
+            uuid=job_uuid, status='queued'
+        ).update({"status": "running", "started_at": str(datetime.datetime.now())})
+        self.session.commit()
+        return claimed == 1
+        
+    def add_upload(self, project_uuid, filename, kind, size, user_id=None):
+        upload = Upload(
+            uuid=str(uuid.uuid4()),
+            project_uuid=project_uuid,
+            user_id=user_id,
+            filename=filename,
+            kind=kind,
+            size=size,
+            status='uploading'
+        )
+        self.session.add(upload)
+        self.session.commit()
+        return upload.to_dict()
+        
+    def get_upload(self, upload_uuid, user_id=None):
+        query = self.session.query(Upload).filter_by(uuid=upload_uuid)
+        
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+            
+        upload = query.first()
+        return upload.to_dict() if upload else None
+        
+    def update_upload(self, upload_uuid, **fields):
+        """Update upload columns; result is JSON encoded. Returns the upload or None"""
+        upload = self.session.query(Upload).filter_by(uuid=upload_uuid).first()
+        if not upload:
+            return None
+            
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        for key, value in fields.items():
+            setattr(upload, key, value)
+            
+        self.session.commit()
+        return upload.to_dict()
+        
+    def claim_upload(self, upload_uuid):
+        """
+        Move an upload from 'uploading' to 'completing' in one UPDATE, so only
+        one of several concurrent completion requests gets to finish it.
+        """
+        claimed = self.session.query(Upload).filter_by(
+            uuid=upload_uuid, status='uploading'
+        ).update({"status": "completing"})
+        self.session.commit()
+        return claimed == 1
+        
+    def get_stale_uploads(self, created_before):
+        """Uploads never completed that were created before the given time"""
+        uploads = self.session.query(Upload).filter(
+            Upload.status.in_(('uploading', 'failed')),
+            Upload.created_at < created_before
+        ).all()
+        return [upload.to_dict() for upload in uploads]
+
+    def delete_upload(self, upload_uuid):
+        deleted = self.session.query(Upload).filter_by(uuid=upload_uuid).delete()
+        self.session.commit()
+        return deleted == 1
+
+# -----------------------------------------------------------------------------
@@ -1,142 +1,464 @@
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import errno
+import hashlib
+import io
+import json
 import yaml
 import os
-from backend.database.models import *
+import numpy as np
+try:
+    from database.models import *
+except ImportError:
+    # Imported from the repository root (scripts, test.py)
+    from backend.database.models import *
 import shutil
+import tarfile
+import time
+import zipfile
 DB_PATH = "db.sqlite"
+# Directory the stored image paths (uploads/...) are relative to
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Dataset splits and the share of images each one gets
+SPLITS = (("train", 0.7), ("val", 0.2), ("test", 0.1))
+
+# One YOLO label line: <class_id> <x_center> <y_center> <width> <height>
+YOLO_LINE = "%d %.6f %.6f %.6f %.6f\n"
+
+# Threads used when images have to be copied byte by byte
+COPY_WORKERS = int(os.environ.get('EXPORT_COPY_WORKERS', min(32, (os.cpu_count() or 1) * 4)))
+
+# Per-image record of the last export, used by incremental runs
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# Archive formats served by stream_archive and the chunk size used to read images
+ARCHIVE_FORMATS = ('zip', 'tar')
+STREAM_CHUNK_SIZE = 256 * 1024
+# Already-compressed formats are stored as is in ZIP archives
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+# Linux ioctl that clones a file's extents (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+# Ways to put an image into the export, cheapest first
+LINK_MODES = ("hardlink", "reflink", "copy")
+
+def _reflink(src: str, dst: str) -> None:
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+
+@contextmanager
+def _export_lock(export_dir: str):
+    """
+    Exclusive lock on an export directory for a whole export run. Export
+    jobs run in worker processes, so the lock is an flock on a file next
+    to the directory rather than a threading lock.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        # No flock on Windows: runs of one project are not serialized there
+        yield
+        return
+    lock_path = os.path.normpath(export_dir) + '.lock'
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class _ArchiveBuffer(io.RawIOBase):
+    """Unseekable sink that archive writers fill and the HTTP stream drains"""
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
 
 class DatasetExporter:
-    def __init__(self, project_uuid: str, export_dir: str):
+    def __init__(self, project_uuid: str, export_dir: Optional[str] = None, root: str = ROOT, user_id=None):
+        """export_dir can be left out when the dataset is only streamed with stream_archive"""
         self.database = DBSession(DB_PATH)
         self.project_uuid = project_uuid
         self.export_dir = export_dir
-        self.image_dir = os.path.join(export_dir, 'images')
-        self.label_dir = os.path.join(export_dir, 'labels')
+        self.root = root
+        self.user_id = user_id
+        self.image_dir = os.path.join(export_dir, 'images') if export_dir else None
+        self.label_dir = os.path.join(export_dir, 'labels') if export_dir else None
+        # First materialization method that works for this export target
+        self._link_mode = None
+        # Boxes left out of the last export because their label is not one of the project's
+        self.dropped_boxes = 0
+
+    @staticmethod
+    def split_for(image_uuid: str) -> str:
+        """
+        Assign an image to a split from a hash of its uuid, so an image keeps
+        its split when other images are added to or removed from the project.
+        """
+        bucket = int(hashlib.md5(image_uuid.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+        for split, share in SPLITS:
+            if bucket < share:
+                return split
+            bucket -= share
+        return SPLITS[-1][0]
+
+    @staticmethod
+    def to_yolo(boxes: np.ndarray) -> np.ndarray:
+        """
+        Convert an (N, 4) array of normalized top-left boxes (x, y, width,
+        height) to YOLO center boxes, clipped to the image.
+        """
+        x1 = np.clip(boxes[:, 0], 0.0, 1.0)
+        y1 = np.clip(boxes[:, 1], 0.0, 1.0)
+        x2 = np.clip(boxes[:, 0] + boxes[:, 2], 0.0, 1.0)
+        y2 = np.clip(boxes[:, 1] + boxes[:, 3], 0.0, 1.0)
+        return np.stack([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], axis=1)
+
+    def _get_labels(self) -> List[Dict]:
+        project = self.database.get_project_by_uuid(self.project_uuid, self.user_id)
+        if not project:
+            raise ValueError(f"Project with UUID {self.project_uuid} not found")
+
+        labels, error = self.database.get_project_labels(self.project_uuid)
+        if error:
+            raise ValueError(error)
+        return labels
 
     def prepare_coco8_yaml(self) -> Dict:
         """
         Prepare COCO8 YAML format from project data.
         Returns a dictionary with the YAML content.
         """
-        project = self.database.get_project_by_uuid(self.project_uuid, user_id=1)
-        if not project:
-            raise ValueError(f"Project with UUID {self.project_uuid} not found")
+        labels = self._get_labels()
 
-        # Get all labels for the project
-        labels = self.database.get_project_labels(self.project_uuid)
-        label_names = [label.name for label in labels]
-
-        # Create label to index mapping (YOLO format requires numeric indices)
-        label_to_idx = {label.name: idx for idx, label in enumerate(labels)}
-
-        # Get all images and their annotations
-        images = self.database.get_project_images(self.project_uuid)
-        
-        # Prepare paths and splits
-        train_images = []
-        val_images = []
-        test_images = []
-
-        # For simplicity, split: 70% train, 20% val, 10% test
-        total_images = len(images)
-        train_split = int(total_images * 0.7)
-        val_split = int(total_images * 0.2)
-
-        for idx, image in enumerate(images):
-            image_path = os.path.join(self.image_dir, image.file_path)
-            
-            # Determine which split this image belongs to
-            if idx < train_split:
-                train_images.append(image_path)
-            elif idx < train_split + val_split:
-                val_images.append(image_path)
-            else:
-                test_images.append(image_path)
-
-        # Prepare YAML content
-        yaml_content = {
-            'path': self.export_dir,  # Root directory
-            'train': train_images,    # Train images
-            'val': val_images,        # Val images
-            'test': test_images,      # Test images
-            
-            'names': {                # Label names
-                idx: name for idx, name in enumerate(label_names)
-            },
-            
-            'nc': len(labels),        # Number of classes
+        # Prepare YAML content, split entries are relative to 'path'; without
+        # it (streamed archives) the dataset root is the directory of the YAML
+        yaml_content = {}
+        if self.export_dir:
+            yaml_content['path'] = os.path.abspath(self.export_dir)  # Root directory
+        for split, _ in SPLITS:
+            yaml_content[split] = os.path.join('images', split)
+
+        yaml_content['names'] = {     # Label names
+            idx: label["name"] for idx, label in enumerate(labels)
         }
+        yaml_content['nc'] = len(labels)  # Number of classes
 
         return yaml_content
 
-    def export_annotations(self) -> None:
+    def _load_manifest(self) -> Dict:
+        manifest_path = os.path.join(self.export_dir, MANIFEST_NAME)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest.get('images', {})
+
+    def _save_manifest(self, entries: Dict) -> None:
+        # Write to a temp file and rename, so an interrupted run never
+        # leaves a truncated manifest behind
+        manifest_path = os.path.join(self.export_dir, MANIFEST_NAME)
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'images': entries}, f)
+        os.replace(tmp_path, manifest_path)
+
+    def _remove_entry_files(self, entry: Dict) -> None:
+        for key in ('image', 'label'):
+            try:
+                os.unlink(os.path.join(self.export_dir, entry[key]))
+            except FileNotFoundError:
+                pass
+
+    def export_annotations(self, progress: Optional[Callable[[int, int], None]] = None,
+                           incremental: bool = False) -> Dict[str, int]:
         """
         Export annotations in YOLO format (one .txt file per image).
         Format: <class_id> <x_center> <y_center> <width> <height>
         All values are normalized to [0, 1]
+        Every run records image uuid -> label hash -> exported files in the
+        manifest. With incremental=True images whose entry is unchanged are
+        left alone; images gone from the project are always pruned.
+        progress is called with (done, total) while images are materialized.
+        Returns counts of exported, unchanged and removed images, and of
+        dropped boxes.
         """
-        project = self.database.get_project_by_uuid(self.project_uuid, user_id=1)
-        if not project:
-            raise ValueError(f"Project with UUID {self.project_uuid} not found")
+        label_files = self._label_files()
+
+        for split, _ in SPLITS:
+            os.makedirs(os.path.join(self.image_dir, split), exist_ok=True)
+            os.makedirs(os.path.join(self.label_dir, split), exist_ok=True)
+
+        previous = self._load_manifest()
+        entries = {}
+        materialize = []
+        unchanged = 0
+        for image, split, filename, text in label_files:
+            # The label text carries class ids and boxes, so its hash changes
+            # with annotations and with label reordering or deletion
+            entry = {
+                'hash': hashlib.sha1(text.encode()).hexdigest(),
+                'split': split,
+                'source': image["file_path"],
+                'image': os.path.join('images', split, filename),
+                'label': os.path.join('labels', split, f"{os.path.splitext(filename)[0]}.txt"),
+            }
+            entries[image["uuid"]] = entry
 
-        # Get label mapping
-        labels = self.database.get_project_labels(self.project_uuid, user_id=1)[0]
-        print(f"-> Labels: {labels}")
-        label_to_idx = {label["name"]: idx for idx, label in enumerate(labels)}
+            old_entry = previous.get(image["uuid"])
+            if incremental and old_entry == entry and \
+                    os.path.exists(os.path.join(self.export_dir, entry['image'])) and \
+                    os.path.exists(os.path.join(self.export_dir, entry['label'])):
+                unchanged += 1
+                continue
+            if old_entry and (old_entry.get('image'), old_entry.get('label')) != (entry['image'], entry['label']):
+                # Moved to another split
+                self._remove_entry_files(old_entry)
+
+            materialize.append((os.path.join(self.root, image["file_path"]),
+                                os.path.join(self.export_dir, entry['image'])))
+
+            # Create annotation file for this image, written in one call
+            with open(os.path.join(self.export_dir, entry['label']), 'w', buffering=1 << 16) as f:
+                f.write(text)
+
+        self.materialize_images(materialize, progress)
+
+        # Prune images deleted from the project or no longer annotated
+        removed = 0
+        for image_uuid, old_entry in previous.items():
+            if image_uuid not in entries:
+                self._remove_entry_files(old_entry)
+                removed += 1
 
-        # Create labels directory if it doesn't exist
-        os.makedirs(self.label_dir, exist_ok=True)
+        self._save_manifest(entries)
+
+        return {'exported': len(materialize), 'unchanged': unchanged, 'removed': removed,
+                'dropped': self.dropped_boxes}
+
+    def _label_files(self) -> List[Tuple[Dict, str, str, str]]:
+        """
+        Build the YOLO label text of every annotated image. Boxes whose label
+        belongs to another project have no class id here; they are left out
+        and counted in dropped_boxes.
+        Returns (image, split, image filename, label text) tuples.
+        """
+        # Get label mapping (YOLO format requires numeric indices)
+        labels = self._get_labels()
+        label_to_idx = {label["id"]: idx for idx, label in enumerate(labels)}
 
-        # Get all images and their annotations
-        images = self.database.get_project_images(self.project_uuid, user_id=1)
-        
+        # Get all images and their annotations (one query for the whole project)
+        images = self.database.get_project_images(self.project_uuid, self.user_id)
+        project_annotations = self.database.get_project_annotations(self.project_uuid, self.user_id)[0]
+
+        # Flatten every box of the project into arrays, grouped by image
+        exported = []
+        offsets = [0]
+        class_ids = []
+        boxes = []
+        self.dropped_boxes = 0
         for image in images:
-            annotations = self.database.get_image_annotations(image["uuid"])
-            
-            if len(annotations[0]) == 0:
+            annotations = project_annotations.get(image["uuid"], [])
+            kept = [ann for ann in annotations if ann["label"]["id"] in label_to_idx]
+            self.dropped_boxes += len(annotations) - len(kept)
+            if len(kept) == 0:
+                continue
+            exported.append(image)
+            for ann in kept:
+                class_ids.append(label_to_idx[ann["label"]["id"]])
+                boxes.append((ann["x"], ann["y"], ann["width"], ann["height"]))
+            offsets.append(len(boxes))
+
+        rows = np.empty((len(boxes), 5), dtype=np.float64)
+        if boxes:
+            rows[:, 0] = class_ids
+            rows[:, 1:] = self.to_yolo(np.asarray(boxes, dtype=np.float64))
+
+        label_files = []
+        for i, image in enumerate(exported):
+            image_rows = rows[offsets[i]:offsets[i + 1]]
+            label_files.append((
+                image,
+                self.split_for(image["uuid"]),
+                os.path.basename(image["file_path"]),
+                (YOLO_LINE * len(image_rows)) % tuple(image_rows.ravel())
+            ))
+
+        return label_files
+
+    def _materialize_one(self, src: str, dst: str) -> str:
+        if os.path.exists(dst):
+            # Unchanged since the last export: same inode, or same size and mtime
+            src_stat, dst_stat = os.stat(src), os.stat(dst)
+            if os.path.samestat(src_stat, dst_stat) or (
+                    src_stat.st_size == dst_stat.st_size and
+                    int(src_stat.st_mtime) == int(dst_stat.st_mtime)):
+                return "skip"
+            os.unlink(dst)
+
+        modes = LINK_MODES[LINK_MODES.index(self._link_mode or LINK_MODES[0]):]
+        for mode in modes:
+            try:
+                if mode == "hardlink":
+                    os.link(src, dst)
+                elif mode == "reflink":
+                    _reflink(src, dst)
+                else:
+                    shutil.copy2(src, dst)
+            except (OSError, ImportError) as e:
+                # Only "not possible here" errors fall through to the next mode
+                if mode == "copy" or (isinstance(e, OSError) and e.errno not in (
+                        errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY,
+                        errno.EINVAL, errno.EMLINK)):
+                    raise
                 continue
-            print(f"-> Image: {image}")
-            print(f"-> Annotations: {annotations}")
-
-            # copy image to label_dir
-            shutil.copy(image["file_path"], self.label_dir)
-
-            # Create annotation file for this image
-            # label_file = os.path.join(self.label_dir, f"{os.path.splitext(image['file_path'])[0]}.txt")
-            
-            # with open(label_file, 'w') as f:
-            #     for ann in annotations:
-            #         # Convert to YOLO format:
-            #         # <class_id> <x_center> <y_center> <width> <height>
-            #         class_id = label_to_idx[ann["label"]["name"]]
-                    
-            #         # Annotations are already in UV format (0-1)
-            #         x_center = ann.x + (ann.width / 2)
-            #         y_center = ann.y + (ann.height / 2)
-                    
-            #         # Write YOLO format line
-            #         f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {ann.width:.6f} {ann.height:.6f}\n")
-
-    def export_dataset(self) -> str:
+            self._link_mode = mode
+            return mode
+
+    def materialize_images(self, pairs: List[Tuple[str, str]],
+                           progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """
+        Put source images at their export paths. Hardlinks are used when the
+        export shares a filesystem with the uploads, reflinks where the
+        filesystem supports them, and a thread-pool copy otherwise.
+        Args:
+            pairs: (source path, destination path) tuples
+            progress: Called with (done, total) after every image
+        Returns:
+            Number of images handled per method
+        """
+        stats = {mode: 0 for mode in LINK_MODES + ("skip",)}
+        total = len(pairs)
+        if total == 0:
+            return stats
+
+        with ThreadPoolExecutor(max_workers=COPY_WORKERS) as pool:
+            futures = [pool.submit(self._materialize_one, src, dst) for src, dst in pairs]
+            for done, future in enumerate(futures, 1):
+                stats[future.result()] += 1
+                if progress:
+                    progress(done, total)
+
+        return stats
+
+    def export_dataset(self, progress: Optional[Callable[[int, int], None]] = None,
+                       incremental: bool = False) -> str:
         """
         Export the complete dataset:
         1. Create directory structure
-        2. Export annotations
+        2. Export annotations (only changed images when incremental)
         3. Create YAML file
+        Runs on the same export directory wait for each other, so their
+        pruning and manifest updates never interleave.
         Returns the path to the YAML file
         """
-        # Create directories
-        os.makedirs(self.image_dir, exist_ok=True)
-        os.makedirs(self.label_dir, exist_ok=True)
+        if not self.export_dir:
+            raise ValueError("No export directory given")
+
+        with _export_lock(self.export_dir):
+            # Create directories
+            os.makedirs(self.image_dir, exist_ok=True)
+            os.makedirs(self.label_dir, exist_ok=True)
+
+            # Export annotations
+            self.export_annotations(progress, incremental)
+
+            # Create YAML file
+            yaml_content = self.prepare_coco8_yaml()
+            yaml_path = os.path.join(self.export_dir, 'dataset.yaml')
 
-        # Export annotations
-        self.export_annotations()
+            with open(yaml_path, 'w') as f:
+                yaml.dump(yaml_content, f, sort_keys=False)
 
-        # Create YAML file
+        return yaml_path
+
+    def stream_archive(self, fmt: str = 'zip') -> Iterator[bytes]:
+        """
+        Stream the dataset (images, labels, dataset.yaml) as a ZIP or tar
+        archive without writing anything to disk. Entries are generated and
+        yielded chunk by chunk, so memory stays flat whatever the project size.
+        Already-compressed images are stored in ZIP archives, text is deflated.
+        """
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {fmt}")
+
+        # Read everything from the database up front, the generator below may
+        # run after the request's session has been released
+        label_files = self._label_files()
         yaml_content = self.prepare_coco8_yaml()
-        yaml_path = os.path.join(self.export_dir, 'dataset.yaml')
-        
-        with open(yaml_path, 'w') as f:
-            yaml.dump(yaml_content, f, sort_keys=False)
+        # Without 'path' the dataset root is the directory of the YAML file
+        yaml_content.pop('path', None)
+        dataset_yaml = yaml.dump(yaml_content, sort_keys=False).encode()
+
+        def entries():
+            yield 'dataset.yaml', dataset_yaml, None
+            for image, split, filename, text in label_files:
+                stem = os.path.splitext(filename)[0]
+                yield f"images/{split}/{filename}", None, os.path.join(self.root, image["file_path"])
+                yield f"labels/{split}/{stem}.txt", text.encode(), None
+
+        def read_chunks(path):
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        def generate_zip():
+            buffer = _ArchiveBuffer()
+            with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+                for name, data, path in entries():
+                    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                    if path and os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+                        info.compress_type = zipfile.ZIP_STORED
+                    else:
+                        info.compress_type = zipfile.ZIP_DEFLATED
+                    with archive.open(info, 'w', force_zip64=True) as entry:
+                        for chunk in (read_chunks(path) if path else (data,)):
+                            entry.write(chunk)
+                            yield buffer.drain()
+                    yield buffer.drain()
+            yield buffer.drain()
+
+        def generate_tar():
+            for name, data, path in entries():
+                info = tarfile.TarInfo(name)
+                info.size = os.path.getsize(path) if path else len(data)
+                info.mtime = int(time.time())
+                info.mode = 0o644
+                yield info.tobuf(tarfile.GNU_FORMAT)
+                yield from (read_chunks(path) if path else (data,))
+                # Entries are padded to whole 512-byte blocks
+                padding = -info.size % tarfile.BLOCKSIZE
+                if padding:
+                    yield b'\0' * padding
+            # End-of-archive marker: two zero blocks
+            yield b'\0' * (tarfile.BLOCKSIZE * 2)
 
-        return yaml_path 
\ No newline at end of file
+        chunks = generate_zip() if fmt == 'zip' else generate_tar()
+        return (chunk for chunk in chunks if chunk)
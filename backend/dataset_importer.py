@@ -0,0 +1,436 @@
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+import json
+import os
+import posixpath
+import tarfile
+import zipfile
+import zlib
+import numpy as np
+import yaml
+try:
+    from database.models import *
+except ImportError:
+    # Imported from the repository root (scripts, test.py)
+    from backend.database.models import *
+DB_PATH = "db.sqlite"
+
+# Files listing the YOLO class names one per line (data.yaml 'names' works too)
+CLASS_NAME_FILES = {'classes.txt', 'obj.names'}
+# Archive members read as YOLO labels or class names; larger ones are skipped
+TEXT_EXTENSIONS = {'.txt', '.names', '.yaml', '.yml'}
+MAX_TEXT_MEMBER_SIZE = 16 * 1024 * 1024
+# COCO annotation files inside archives are loaded whole
+MAX_COCO_MEMBER_SIZE = int(os.environ.get('MAX_COCO_MEMBER_SIZE', 1024 * 1024 * 1024))
+
+# YOLO label files parsed and validated per NumPy batch, COCO annotations per
+# batch, and annotations inserted per statement
+YOLO_FILE_BATCH_SIZE = 20000
+COCO_BATCH_SIZE = 100000
+ANNOTATION_BATCH_SIZE = 10000
+
+# Raised by zipfile and tarfile (and the decompressors under them) for
+# truncated or corrupt archives
+ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError)
+
+class ArchiveMember:
+    """Archive member stream whose corrupt-archive errors are ValueErrors"""
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            return self._stream.read(size)
+        except ARCHIVE_ERRORS as e:
+            raise ValueError(f"Corrupt archive: {e}") from e
+
+def iter_archive(f: BinaryIO) -> Iterator[Tuple[str, BinaryIO, int]]:
+    """
+    Regular files of a ZIP or (optionally compressed) tar archive as
+    (name, stream, size), in archive order. Each stream has to be read
+    before the next member is requested: tar archives are read front to
+    back without seeking. A truncated or corrupt archive raises ValueError,
+    while iterating or while reading a member.
+    """
+    try:
+        if zipfile.is_zipfile(f):
+            f.seek(0)
+            with zipfile.ZipFile(f) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        with archive.open(info) as member:
+                            yield info.filename, ArchiveMember(member), info.file_size
+            return
+
+        f.seek(0)
+        try:
+            archive = tarfile.open(fileobj=f, mode='r|*')
+        except tarfile.TarError:
+            raise ValueError("Not a ZIP or tar archive")
+        with archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, ArchiveMember(archive.extractfile(info)), info.size
+    except ARCHIVE_ERRORS as e:
+        raise ValueError(f"Corrupt archive: {e}") from e
+
+def member_parts(name: str) -> Optional[List[str]]:
+    """Path components of a member name, None for hidden files and macOS metadata"""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or any(part.startswith('.') or part == '__MACOSX' for part in parts):
+        return None
+    return parts
+
+def label_key(parts: List[str]) -> str:
+    """
+    Key pairing an image with its YOLO label file: images/train/a.jpg and
+    labels/train/a.txt both map to labels/train/a, and an image and a label
+    file in the same folder share a key too.
+    """
+    parts = list(parts)
+    parts[-1] = posixpath.splitext(parts[-1])[0]
+    for i in range(len(parts) - 2, -1, -1):
+        if parts[i] == 'images':
+            parts[i] = 'labels'
+            break
+    return '/'.join(parts)
+
+def load_json_member(parts: List[str], member: BinaryIO):
+    """Parsed JSON archive member, ValueError naming the member if it is not JSON"""
+    try:
+        return json.load(member)
+    except ValueError:
+        raise ValueError(f"Not a valid JSON file: {'/'.join(parts)}")
+
+def phase_progress(progress: Optional[Callable[[int, int], None]], phase: int,
+                   phases: int) -> Optional[Callable[[int, int], None]]:
+    """Report (done, total) of one of several equal phases as progress over all of them"""
+    if not progress:
+        return None
+    def report(done, total):
+        if total:
+            progress(phase * total + done, phases * total)
+    return report
+
+def parse_class_names(filename: str, text: str) -> Dict[int, str]:
+    """Class id -> name from a classes.txt / obj.names file or a YOLO data.yaml"""
+    if filename in CLASS_NAME_FILES:
+        names = [line.strip() for line in text.splitlines() if line.strip()]
+        return dict(enumerate(names))
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError:
+        return {}
+    names = data.get('names') if isinstance(data, dict) else None
+    if isinstance(names, list):
+        return {idx: str(name) for idx, name in enumerate(names)}
+    if isinstance(names, dict):
+        class_names = {}
+        for idx, name in names.items():
+            # Keys that aren't class ids can't match any label line; skip them
+            try:
+                class_names[int(idx)] = str(name)
+            except (TypeError, ValueError):
+                continue
+        return class_names
+    return {}
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _to_floats(values: List) -> np.ndarray:
+    """Parse numbers in one go; anything unparsable becomes NaN and fails validation"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter((_to_float(value) for value in values), dtype=np.float64, count=len(values))
+
+def _coco_bbox(annotation) -> List[float]:
+    bbox = annotation.get("bbox") if isinstance(annotation, dict) else None
+    if isinstance(bbox, (list, tuple)) and len(bbox) == 4:
+        return [_to_float(value) for value in bbox]
+    return [np.nan] * 4
+
+class DatasetImporter:
+    def __init__(self, project_uuid: str, user_id=None):
+        self.database = DBSession(DB_PATH)
+        self.project_uuid = project_uuid
+        self.user_id = user_id
+        # Label name -> id, filled as labels are looked up or created
+        self._label_ids = {}
+        self._used_labels = set()
+        # Original filename -> (image id, width, height) of the project's images
+        self._image_index = None
+        self._transactions = 0
+        self.stats = {"annotations": 0, "labels": 0, "invalid": 0, "unmatched": 0}
+
+    @staticmethod
+    def from_yolo(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Validate an (N, 5) array of YOLO rows (class, x_center, y_center,
+        width, height, normalized) and convert them to the normalized
+        top-left boxes the editor stores, clipped to the image.
+        Returns (valid mask, class ids, (N, 4) boxes).
+        """
+        class_ids, centers, sizes = rows[:, 0], rows[:, 1:3], rows[:, 3:5]
+        valid = (np.isfinite(rows).all(axis=1)
+                 & (class_ids >= 0) & (class_ids == np.floor(class_ids))
+                 # Coordinates past 1 are pixels, not a YOLO label
+                 & ((centers >= 0) & (centers <= 1)).all(axis=1)
+                 & ((sizes > 0) & (sizes <= 1)).all(axis=1))
+        top_left = np.clip(centers - sizes / 2, 0.0, 1.0)
+        bottom_right = np.clip(centers + sizes / 2, 0.0, 1.0)
+        valid &= (bottom_right > top_left).all(axis=1)
+        class_ids = np.where(valid, class_ids, -1).astype(np.int64)
+        return valid, class_ids, np.concatenate([top_left, bottom_right - top_left], axis=1)
+
+    @staticmethod
+    def from_coco(bboxes: np.ndarray, image_sizes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Validate an (N, 4) array of COCO pixel boxes (x, y, width, height)
+        against the (N, 2) sizes of their images and normalize them,
+        clipped to the image. Returns (valid mask, (N, 4) boxes).
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            top_left = np.clip(bboxes[:, :2] / image_sizes, 0.0, 1.0)
+            bottom_right = np.clip((bboxes[:, :2] + bboxes[:, 2:]) / image_sizes, 0.0, 1.0)
+            valid = (np.isfinite(bboxes).all(axis=1)
+                     & np.isfinite(image_sizes).all(axis=1) & (image_sizes > 0).all(axis=1)
+                     & (bboxes[:, 2:] > 0).all(axis=1)
+                     & (bottom_right > top_left).all(axis=1))
+        return valid, np.concatenate([top_left, bottom_right - top_left], axis=1)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Keep everything imported inside the block in one transaction: it is
+        committed when the outermost block exits and rolled back if it
+        raises, so a failed or cancelled import leaves no annotations or
+        labels behind.
+        """
+        self._transactions += 1
+        try:
+            yield
+            if self._transactions == 1:
+                self.database.session.commit()
+        except BaseException:
+            if self._transactions == 1:
+                self.database.session.rollback()
+                self._label_ids = {}
+            raise
+        finally:
+            self._transactions -= 1
+
+    def image_index(self) -> Dict[str, Tuple[int, Optional[int], Optional[int]]]:
+        if self._image_index is None:
+            if not self.database.get_project_by_uuid(self.project_uuid, self.user_id):
+                raise ValueError(f"Project with UUID {self.project_uuid} not found")
+            self._image_index = self.database.get_project_image_index(self.project_uuid)
+        return self._image_index
+
+    def _get_label_ids(self, names) -> Dict[str, int]:
+        missing = set(names) - self._label_ids.keys()
+        if missing:
+            label_ids, error = self.database.get_or_create_labels(self.project_uuid, missing, commit=False)
+            if error:
+                raise ValueError(error)
+            self._label_ids.update(label_ids)
+        self._used_labels.update(names)
+        self.stats["labels"] = len(self._used_labels)
+        return self._label_ids
+
+    def _insert(self, image_ids: np.ndarray, label_ids: np.ndarray, boxes: np.ndarray) -> int:
+        inserted = 0
+        for start in range(0, len(boxes), ANNOTATION_BATCH_SIZE):
+            end = start + ANNOTATION_BATCH_SIZE
+            inserted += self.database.add_annotations_bulk([
+                {"image_id": image_id, "label_id": label_id, "x": x, "y": y, "width": width, "height": height}
+                for image_id, label_id, (x, y, width, height) in zip(
+                    image_ids[start:end].tolist(), label_ids[start:end].tolist(), boxes[start:end].tolist()
+                )
+            ], commit=False)
+        self.stats["annotations"] += inserted
+        return inserted
+
+    def import_yolo(self, label_files: Dict[str, str], class_names: Optional[Dict[int, str]] = None,
+                    image_ids: Optional[Dict[str, int]] = None,
+                    progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Import YOLO label files as annotations, in one transaction. Rows are
+        parsed, validated and converted as one NumPy array per
+        YOLO_FILE_BATCH_SIZE files, and labels named after the classes are
+        created as needed. Boxes are added next to the existing annotations:
+        importing the same files twice duplicates them.
+        Args:
+            label_files: Label file name -> file content
+            class_names: Class id -> label name, classes without one are named by their id
+            image_ids: Label file name -> image id; by default a file matches
+                the project image whose filename has the same stem
+            progress: Called with (files done, total files)
+        Returns:
+            The importer stats
+        """
+        class_names = class_names or {}
+        if image_ids is None:
+            stems = {}
+            for filename, (image_id, _, _) in self.image_index().items():
+                stems.setdefault(os.path.splitext(filename)[0], image_id)
+            image_ids = {name: stems.get(posixpath.splitext(posixpath.basename(name))[0])
+                         for name in label_files}
+
+        items = list(label_files.items())
+        with self.transaction():
+            for start in range(0, len(items), YOLO_FILE_BATCH_SIZE):
+                values, row_images = [], []
+                for name, text in items[start:start + YOLO_FILE_BATCH_SIZE]:
+                    image_id = image_ids.get(name)
+                    if image_id is None:
+                        self.stats["unmatched"] += 1
+                        continue
+                    for line in text.splitlines():
+                        row = line.split()
+                        if not row:
+                            continue
+                        # Segmentation polygons and other formats are not boxes
+                        if len(row) != 5:
+                            self.stats["invalid"] += 1
+                            continue
+                        values.extend(row)
+                        row_images.append(image_id)
+
+                if row_images:
+                    valid, class_ids, boxes = self.from_yolo(_to_floats(values).reshape(-1, 5))
+                    self.stats["invalid"] += int(len(valid) - valid.sum())
+                    class_ids = class_ids[valid]
+                    used = np.unique(class_ids)
+                    names = [class_names.get(int(class_id), str(class_id)) for class_id in used]
+                    label_ids = self._get_label_ids(names)
+                    label_column = np.array([label_ids[name] for name in names], dtype=np.int64)
+                    self._insert(np.array(row_images, dtype=np.int64)[valid],
+                                 label_column[np.searchsorted(used, class_ids)], boxes[valid])
+                if progress:
+                    progress(min(start + YOLO_FILE_BATCH_SIZE, len(items)), len(items))
+
+        return dict(self.stats)
+
+    def import_coco(self, coco: Dict, images: Optional[Dict[str, Tuple[int, Optional[int], Optional[int]]]] = None,
+                    progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Import the boxes of a COCO detection file, in one transaction. Images
+        are matched by the filename of images[].file_name, categories become
+        labels, and boxes are validated and normalized as NumPy arrays
+        COCO_BATCH_SIZE at a time. As with YOLO files, a re-run adds the
+        boxes again.
+        Args:
+            coco: Parsed COCO JSON
+            images: Filename -> (image id, width, height), the project's images by default
+            progress: Called with (annotations done, total annotations)
+        Returns:
+            The importer stats
+        """
+        if not isinstance(coco, dict):
+            raise ValueError("Not a COCO annotation file")
+        images = self.image_index() if images is None else images
+        categories = {
+            category["id"]: str(category.get("name", category["id"]))
+            for category in coco.get("categories") or [] if isinstance(category, dict) and "id" in category
+        }
+
+        # COCO image id -> (image id, width, height); COCO sizes win over stored ones
+        matched = {}
+        for image in coco.get("images") or []:
+            if not isinstance(image, dict):
+                continue
+            entry = images.get(posixpath.basename(str(image.get("file_name", "")).replace('\\', '/')))
+            if entry is None:
+                self.stats["unmatched"] += 1
+                continue
+            image_id, width, height = entry
+            matched[image.get("id")] = (image_id, image.get("width") or width, image.get("height") or height)
+
+        annotations = coco.get("annotations") or []
+        unknown = (None, None, None)
+        with self.transaction():
+            for start in range(0, len(annotations), COCO_BATCH_SIZE):
+                batch = [annotation for annotation in annotations[start:start + COCO_BATCH_SIZE]
+                         if isinstance(annotation, dict)]
+                self.stats["invalid"] += min(COCO_BATCH_SIZE, len(annotations) - start) - len(batch)
+                if batch:
+                    targets = [matched.get(annotation.get("image_id"), unknown) for annotation in batch]
+                    category_names = [categories.get(annotation.get("category_id")) for annotation in batch]
+                    image_sizes = np.array([(_to_float(width), _to_float(height)) for _, width, height in targets],
+                                           dtype=np.float64)
+                    valid, boxes = self.from_coco(np.array([_coco_bbox(a) for a in batch], dtype=np.float64),
+                                                  image_sizes)
+                    valid &= np.array([target[0] is not None and name is not None
+                                       for target, name in zip(targets, category_names)], dtype=bool)
+                    self.stats["invalid"] += int(len(valid) - valid.sum())
+
+                    indices = np.flatnonzero(valid)
+                    label_ids = self._get_label_ids({category_names[i] for i in indices})
+                    self._insert(np.array([targets[i][0] for i in indices], dtype=np.int64),
+                                 np.array([label_ids[category_names[i]] for i in indices], dtype=np.int64),
+                                 boxes[indices])
+                if progress:
+                    progress(min(start + COCO_BATCH_SIZE, len(annotations)), len(annotations))
+
+        return dict(self.stats)
+
+    def import_annotations(self, label_files: Dict[str, str], class_names: Dict[int, str], coco_files: List[Dict],
+                           image_ids: Optional[Dict[str, int]] = None,
+                           images: Optional[Dict[str, Tuple[int, Optional[int], Optional[int]]]] = None,
+                           progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Import the YOLO label files and COCO files read from one dataset in
+        a single transaction. Arguments are passed on to import_yolo and
+        import_coco; progress is reported over all of them together.
+        """
+        steps = ([label_files] if label_files else []) + coco_files
+        with self.transaction():
+            for step, data in enumerate(steps):
+                step_progress = phase_progress(progress, step, len(steps))
+                if data is label_files:
+                    self.import_yolo(label_files, class_names, image_ids=image_ids, progress=step_progress)
+                else:
+                    self.import_coco(data, images=images, progress=step_progress)
+        return dict(self.stats)
+
+    def import_file(self, path: str, progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Import annotations for images already in the project from a COCO
+        JSON file, or from a ZIP/tar archive of YOLO label files (with
+        classes.txt or data.yaml for the class names) and/or COCO JSON files.
+        The whole file is imported in one transaction, and progress covers
+        reading the archive and then importing its annotations.
+        """
+        if path.lower().endswith('.json'):
+            with open(path, 'rb') as f:
+                try:
+                    coco = json.load(f)
+                except ValueError:
+                    raise ValueError("Not a valid JSON file")
+            return self.import_coco(coco, progress=progress)
+
+        label_files, class_names, coco_files = {}, {}, []
+        file_size = os.path.getsize(path)
+        read_progress = phase_progress(progress, 0, 2)
+        with open(path, 'rb') as f:
+            for name, member, member_size in iter_archive(f):
+                parts = member_parts(name)
+                extension = posixpath.splitext(parts[-1])[1].lower() if parts else ''
+                if extension == '.json' and member_size <= MAX_COCO_MEMBER_SIZE:
+                    coco_files.append(load_json_member(parts, member))
+                elif extension in TEXT_EXTENSIONS and member_size <= MAX_TEXT_MEMBER_SIZE:
+                    text = member.read().decode('utf-8', errors='replace')
+                    if extension == '.txt' and parts[-1] not in CLASS_NAME_FILES:
+                        label_files['/'.join(parts)] = text
+                    else:
+                        class_names = parse_class_names(parts[-1], text) or class_names
+                if read_progress:
+                    read_progress(f.tell(), file_size)
+
+        return self.import_annotations(label_files, class_names, coco_files,
+                                       progress=phase_progress(progress, 1, 2))
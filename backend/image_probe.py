@@ -0,0 +1,118 @@
+import struct
+from typing import BinaryIO, Optional, Tuple
+
+# Bytes that cover the fixed-position headers of PNG, GIF, BMP and WebP
+HEADER_SIZE = 32
+
+# JPEG start-of-frame markers carrying the image size (C4, C8 and CC are not frames)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Standalone JPEG markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+# EXIF orientations that rotate the image by 90 degrees: browsers and
+# cv2.imread swap width and height for these
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSED = {5, 6, 7, 8}
+
+def get_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Read the dimensions of a JPEG, PNG, WebP, GIF or BMP image from its
+    header, without decoding any pixels.
+    Args:
+        path: Path to the image file
+    Returns:
+        Tuple of (width, height) as displayed, or None if the format is not
+        recognised or the header is broken
+    """
+    try:
+        with open(path, 'rb') as f:
+            return _read_size(f)
+    except (OSError, struct.error, ValueError):
+        return None
+
+def _read_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    head = f.read(HEADER_SIZE)
+
+    if head.startswith(b'\xff\xd8'):
+        f.seek(2)
+        return _jpeg_size(f)
+
+    if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', head[6:10])
+
+    if head.startswith(b'BM'):
+        dib_size = struct.unpack('<I', head[14:18])[0]
+        if dib_size == 12:  # OS/2 BITMAPCOREHEADER
+            return struct.unpack('<HH', head[18:22])
+        width, height = struct.unpack('<ii', head[18:26])
+        # Negative height marks a top-down bitmap
+        return width, abs(height)
+
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        chunk = head[12:16]
+        if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+            width, height = struct.unpack('<HH', head[26:30])
+            return width & 0x3fff, height & 0x3fff
+        if chunk == b'VP8L' and head[20] == 0x2f:
+            bits = struct.unpack('<I', head[21:25])[0]
+            return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+        if chunk == b'VP8X':
+            width = int.from_bytes(head[24:27], 'little') + 1
+            height = int.from_bytes(head[27:30], 'little') + 1
+            return width, height
+
+    return None
+
+def _jpeg_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    """Walk the JPEG segments up to the first frame header"""
+    transposed = False
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        # Fill bytes before a marker
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        # End of image or start of scan before any frame header
+        if marker in (0xD9, 0xDA):
+            return None
+
+        length = struct.unpack('>H', f.read(2))[0]
+        if marker in JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack('>BHH', f.read(5))
+            return (height, width) if transposed else (width, height)
+        if marker == 0xE1:
+            segment = f.read(length - 2)
+            if segment.startswith(b'Exif\x00\x00'):
+                transposed = _exif_orientation(segment[6:]) in EXIF_TRANSPOSED
+        else:
+            f.seek(length - 2, 1)
+
+def _exif_orientation(tiff: bytes) -> Optional[int]:
+    """Orientation tag of the first IFD of an EXIF (TIFF) block"""
+    if tiff[:2] == b'II':
+        order = '<'
+    elif tiff[:2] == b'MM':
+        order = '>'
+    else:
+        return None
+    offset = struct.unpack(order + 'I', tiff[4:8])[0]
+    count = struct.unpack(order + 'H', tiff[offset:offset + 2])[0]
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        tag = struct.unpack(order + 'H', tiff[entry:entry + 2])[0]
+        if tag == EXIF_ORIENTATION_TAG:
+            return struct.unpack(order + 'H', tiff[entry + 8:entry + 10])[0]
+    return None
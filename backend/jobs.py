@@ -0,0 +1,397 @@
+try:
+    from database.models import *
+    from dataset_exporter import DatasetExporter
+    from archive_importer import ArchiveImporter
+    from dataset_importer import DatasetImporter
+    from video_processor import VideoProcessor
+    from proejcts import UPLOAD_FOLDER
+    from thumbnails import make_thumbnails, remove_thumbnails
+    from blob_store import BLOB_FOLDER, BlobStore
+except ImportError:
+    # Imported from the repository root (scripts, test.py)
+    from backend.database.models import *
+    from backend.dataset_exporter import DatasetExporter
+    from backend.archive_importer import ArchiveImporter
+    from backend.dataset_importer import DatasetImporter
+    from backend.video_processor import VideoProcessor
+    from backend.proejcts import UPLOAD_FOLDER
+    from backend.thumbnails import make_thumbnails, remove_thumbnails
+    from backend.blob_store import BLOB_FOLDER, BlobStore
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import multiprocessing
+import threading
+import datetime
+import shutil
+import time
+import uuid
+import os
+
+DB_PATH = "db.sqlite"
+EXPORT_FOLDER = "exports"
+# Next to the database: held shared by every running server process, and
+# exclusively (under the startup lock) by the one that recovers jobs
+SERVER_LOCK_SUFFIX = ".server.lock"
+STARTUP_LOCK_SUFFIX = ".startup.lock"
+
+# Worker processes, i.e. the number of jobs running at the same time
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Minimum number of seconds between two progress writes of a running job
+PROGRESS_INTERVAL = 0.5
+# Video frames registered per database transaction
+FRAME_BATCH_SIZE = 500
+# Decoding processes used by one video job; JOB_WORKERS jobs share the CPUs
+VIDEO_DECODE_WORKERS = int(os.environ.get('VIDEO_DECODE_WORKERS',
+                                          max(1, (os.cpu_count() or 1) // JOB_WORKERS)))
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    """Passed to job handlers inside the worker process"""
+    def __init__(self, database, job_uuid) -> None:
+        self.database = database
+        self.job_uuid = job_uuid
+        self._last_report = 0.0
+
+    def progress(self, done, total=None):
+        """
+        Report progress as a fraction, or as done/total. Writes are throttled
+        and double as cancellation points: a job whose cancellation was
+        requested stops here with JobCancelled.
+        """
+        now = time.monotonic()
+        if now - self._last_report < PROGRESS_INTERVAL and (total is None or done < total):
+            return
+        self._last_report = now
+
+        fraction = done / total if total else done
+        job = self.database.update_job(self.job_uuid, progress=min(max(fraction, 0.0), 1.0))
+        if job and job["cancel_requested"]:
+            raise JobCancelled()
+
+# -----------------------------------------------------------------------------
+# Job handlers, executed in worker processes: handler(context, params) -> result
+def run_export_job(context, params):
+    exporter = DatasetExporter(
+        params["project_uuid"], params["export_dir"],
+        root=params["root"], user_id=params.get("user_id")
+    )
+    yaml_path = exporter.export_dataset(
+        progress=context.progress, incremental=params.get("incremental", False)
+    )
+    return {"yaml_path": yaml_path, "dropped_boxes": exporter.dropped_boxes}
+
+def run_video_job(context, params):
+    """
+    Extract frames into a staging folder and, as they come out of the
+    decoder, move them next to the project's images under uuid names and
+    register them batch by batch. If the job fails or is cancelled, frames
+    of the batch that was not registered yet are removed again.
+    """
+    project_uuid = params["project_uuid"]
+    project_folder = os.path.join(params["root"], UPLOAD_FOLDER, project_uuid)
+    staging_folder = os.path.join(project_folder, f".frames_{context.job_uuid}")
+    video_name = os.path.splitext(params.get("original_filename") or os.path.basename(params["video_path"]))[0]
+    blobs = BlobStore(os.path.join(params["root"], UPLOAD_FOLDER, BLOB_FOLDER))
+
+    def report(done, total):
+        # Without a frame count there is no fraction, but still check for cancellation
+        context.progress(done / total if total else 0.0)
+
+    def register(batch):
+        if context.database.add_project_images(project_uuid, batch, params.get("user_id")) is None:
+            raise ValueError(f"Project with UUID {project_uuid} not found")
+
+    def discard(batch):
+        """Remove frames moved into the project folder but never registered"""
+        context.database.session.rollback()
+        for image in batch:
+            file_path = os.path.join(params["root"], image["file_path"])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            remove_thumbnails(file_path)
+        for content_hash in context.database.get_unreferenced_hashes([image["content_hash"] for image in batch]):
+            blobs.release(content_hash)
+
+    registered = 0
+    batch = []
+    try:
+        with VideoProcessor(os.path.join(params["root"], params["video_path"]), staging_folder) as processor:
+            for frame in processor.iter_frames(
+                params.get("max_frames"), params.get("frame_interval", 1),
+                target_fps=params.get("target_fps"),
+                start_time=params.get("start_time"),
+                end_time=params.get("end_time"),
+                workers=VIDEO_DECODE_WORKERS,
+                image_format=params.get("image_format", "jpg"),
+                quality=params.get("quality"),
+                dedup_threshold=params.get("dedup_threshold"),
+                progress=report
+            ):
+                image_uuid = str(uuid.uuid4())
+                filename = f"{image_uuid}{os.path.splitext(frame['path'])[1]}"
+                content_hash = blobs.store_file(frame["path"], os.path.join(project_folder, filename))
+                batch.append({
+                    "uuid": image_uuid,
+                    "original_filename": f"{video_name}_{os.path.basename(frame['path'])}",
+                    "file_path": os.path.join(UPLOAD_FOLDER, project_uuid, filename),
+                    "file_size": os.path.getsize(os.path.join(project_folder, filename)),
+                    "width": frame["width"],
+                    "height": frame["height"],
+                    "content_hash": content_hash
+                })
+                make_thumbnails(os.path.join(project_folder, filename),
+                                dimensions=(frame["width"], frame["height"]))
+                if len(batch) >= FRAME_BATCH_SIZE:
+                    register(batch)
+                    registered += len(batch)
+                    batch = []
+            if batch:
+                register(batch)
+                registered += len(batch)
+                batch = []
+            stats = processor.stats
+    except Exception:
+        discard(batch)
+        raise
+    finally:
+        shutil.rmtree(staging_folder, ignore_errors=True)
+
+    return {"frames": registered, "video_path": params["video_path"],
+            "decoded": stats["decoded"], "dropped": stats["dropped"]}
+
+def run_archive_job(context, params):
+    importer = ArchiveImporter(params["project_uuid"], root=params["root"], user_id=params.get("user_id"))
+    archive_path = os.path.join(params["root"], params["archive_path"])
+    try:
+        return importer.import_archive(archive_path, progress=context.progress)
+    finally:
+        # Extracted or not, the archive is not kept around; a retry uploads it again
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+
+def run_annotation_import_job(context, params):
+    importer = DatasetImporter(params["project_uuid"], user_id=params.get("user_id"))
+    file_path = os.path.join(params["root"], params["file_path"])
+    try:
+        return importer.import_file(file_path, progress=context.progress)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+JOB_HANDLERS = {
+    "export": run_export_job,
+    "video": run_video_job,
+    "archive": run_archive_job,
+    "annotations": run_annotation_import_job,
+}
+
+def run_job(job_uuid):
+    """Entry point of a worker process for one job"""
+    database = DBSession(DB_PATH)
+    try:
+        # Cancelled (or picked up elsewhere) while it was waiting
+        if not database.claim_job(job_uuid):
+            return
+        job = database.get_job(job_uuid)
+
+        try:
+            result = JOB_HANDLERS[job["type"]](JobContext(database, job_uuid), job["params"])
+        except JobCancelled:
+            database.update_job(job_uuid, status="cancelled", finished_at=str(datetime.datetime.now()))
+        except Exception as e:
+            database.session.rollback()
+            database.update_job(job_uuid, status="failed", error=str(e),
+                                finished_at=str(datetime.datetime.now()))
+        else:
+            database.update_job(job_uuid, status="completed", progress=1.0, result=result,
+                                finished_at=str(datetime.datetime.now()))
+    finally:
+        database.destuctor()
+
+@contextmanager
+def _startup_lock(fcntl):
+    """Serializes server processes checking whether they start first"""
+    with open(os.path.abspath(DB_PATH) + STARTUP_LOCK_SUFFIX, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+# -----------------------------------------------------------------------------
+
+class JobsController:
+    def __init__(self, root) -> None:
+        self.database = DBSession(DB_PATH)
+        self.root = root
+        self.export_folder = os.path.join(root, EXPORT_FOLDER)
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._startup = threading.Lock()
+        self._server_lock = None
+
+    def recover_jobs(self):
+        """
+        Fail the jobs that were running when the server stopped, they can't
+        be resumed, and hand the queued ones to this process's worker pool.
+        Call it once per server start, from the process that serves
+        requests, never while another server process may be running jobs;
+        recover_on_startup() takes care of both.
+        """
+        for job in self.database.get_jobs(status=["running", "queued"], limit=None):
+            if job["status"] == "running":
+                self.database.update_job(job["uuid"], status="failed", error="Interrupted by server restart",
+                                         finished_at=str(datetime.datetime.now()))
+            else:
+                self._submit(job["uuid"])
+        self.database.destuctor()
+
+    def recover_on_startup(self):
+        """
+        Call recover_jobs() once per server start. Every server process keeps
+        a shared flock on the server lock for as long as it runs, so only the
+        first process to start, when no other one can be running jobs, gets
+        it exclusively and recovers; later calls in this process do nothing.
+        Returns:
+            True if this call recovered the jobs
+        """
+        with self._startup:
+            if self._server_lock is not None:
+                return False
+            try:
+                import fcntl
+            except ImportError:
+                # No flock on Windows: assume a single server process
+                self._server_lock = True
+                self.recover_jobs()
+                return True
+            self._server_lock = open(os.path.abspath(DB_PATH) + SERVER_LOCK_SUFFIX, 'a')
+            fileno = self._server_lock.fileno()
+            with _startup_lock(fcntl):
+                try:
+                    fcntl.flock(fileno, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another server process is running; nobody can hold the
+                    # lock exclusively while we hold the startup lock
+                    fcntl.flock(fileno, fcntl.LOCK_SH)
+                    return False
+                try:
+                    self.recover_jobs()
+                finally:
+                    fcntl.flock(fileno, fcntl.LOCK_SH)
+            return True
+
+    def wait(self):
+        """Block until every submitted job has finished"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Forking a process with request threads can copy locks
+                # held by those threads (and open SQLite connections) into
+                # the worker; spawned workers start clean
+                self._executor = ProcessPoolExecutor(max_workers=JOB_WORKERS,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _submit(self, job_uuid):
+        future = self._get_executor().submit(run_job, job_uuid)
+        with self._lock:
+            self._futures[job_uuid] = future
+        future.add_done_callback(lambda f: self._on_done(job_uuid, f))
+
+    def _on_done(self, job_uuid, future):
+        with self._lock:
+            self._futures.pop(job_uuid, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error:
+            # The worker died (e.g. killed or out of memory) before it could
+            # record the outcome itself
+            database = DBSession(DB_PATH)
+            job = database.get_job(job_uuid)
+            if job and job["status"] in ("queued", "running"):
+                database.update_job(job_uuid, status="failed", error=f"Worker error: {error}",
+                                    finished_at=str(datetime.datetime.now()))
+            database.destuctor()
+
+    def submit(self, job_type, params, project_uuid=None, user_id=None):
+        if job_type not in JOB_HANDLERS:
+            return None, f"Unknown job type: {job_type}"
+        job = self.database.add_job(job_type, params, project_uuid, user_id)
+        self._submit(job["uuid"])
+        return job, None
+
+    def submit_export(self, project_uuid, user_id=None, incremental=False):
+        """Export a project as a YOLO dataset under exports/<project_uuid>"""
+        return self.submit("export", {
+            "project_uuid": project_uuid,
+            "export_dir": os.path.join(self.export_folder, project_uuid),
+            "root": self.root,
+            "user_id": user_id,
+            "incremental": incremental
+        }, project_uuid, user_id)
+
+    def submit_video(self, project_uuid, video_path, original_filename, user_id=None,
+                     frame_interval=1, max_frames=None, target_fps=None, start_time=None, end_time=None,
+                     image_format="jpg", quality=None, dedup_threshold=None):
+        """Extract the frames of an uploaded video into the project gallery"""
+        return self.submit("video", {
+            "project_uuid": project_uuid,
+            "video_path": video_path,
+            "original_filename": original_filename,
+            "root": self.root,
+            "user_id": user_id,
+            "frame_interval": frame_interval,
+            "max_frames": max_frames,
+            "target_fps": target_fps,
+            "start_time": start_time,
+            "end_time": end_time,
+            "image_format": image_format,
+            "quality": quality,
+            "dedup_threshold": dedup_threshold
+        }, project_uuid, user_id)
+
+    def submit_archive(self, project_uuid, archive_path, original_filename, user_id=None):
+        """Extract an uploaded dataset archive (images and YOLO labels) into the project"""
+        return self.submit("archive", {
+            "project_uuid": project_uuid,
+            "archive_path": archive_path,
+            "original_filename": original_filename,
+            "root": self.root,
+            "user_id": user_id
+        }, project_uuid, user_id)
+
+    def submit_annotation_import(self, project_uuid, file_path, original_filename, user_id=None):
+        """Import YOLO or COCO annotations for images already in the project"""
+        return self.submit("annotations", {
+            "project_uuid": project_uuid,
+            "file_path": file_path,
+            "original_filename": original_filename,
+            "root": self.root,
+            "user_id": user_id
+        }, project_uuid, user_id)
+
+    def get_job(self, job_uuid, user_id=None):
+        return self.database.get_job(job_uuid, user_id)
+
+    def get_jobs(self, user_id=None, status=None):
+        return self.database.get_jobs(user_id, status)
+
+    def cancel_job(self, job_uuid, user_id=None):
+        job, error = self.database.request_job_cancel(job_uuid, user_id)
+        if job and job["status"] == "cancelled":
+            # Free the pool slot of a job that has not started yet
+            with self._lock:
+                future = self._futures.get(job_uuid)
+            if future:
+                future.cancel()
+        return job, error
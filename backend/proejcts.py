@@ -1,9 +1,119 @@
-from database.models import *
+try:
+    from database.models import *
+    from image_probe import get_image_size
+    from thumbnails import THUMBNAIL_SIZES, make_thumbnails, remove_thumbnails, thumbnail_path
+    from blob_store import BLOB_FOLDER, BlobStore
+except ImportError:
+    # Imported from the repository root (scripts, test.py)
+    from backend.database.models import *
+    from backend.image_probe import get_image_size
+    from backend.thumbnails import THUMBNAIL_SIZES, make_thumbnails, remove_thumbnails, thumbnail_path
+    from backend.blob_store import BLOB_FOLDER, BlobStore
+from werkzeug.security import safe_join
+from werkzeug.sansio.multipart import MultipartDecoder, Data, Epilogue, File, NeedData
+from concurrent.futures import ThreadPoolExecutor
+import time
 import os
+import shutil
 import uuid
 
 DB_PATH = "db.sqlite"
 UPLOAD_FOLDER = "uploads"
+# Image types accepted by uploads and dataset imports
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
+VIDEO_FOLDER = "videos"
+# Uploaded dataset archives, kept until their import job has run
+ARCHIVE_FOLDER = "archives"
+# Bytes read from the request per write while streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Images measured per transaction by backfill_image_dimensions()
+BACKFILL_BATCH_SIZE = 500
+# Staging files of resumable uploads: uploads/<project>/.uploads/<upload>.part
+STAGING_FOLDER = ".uploads"
+# Resumable uploads that received no chunk for this long are deleted
+UPLOAD_EXPIRY = datetime.timedelta(hours=float(os.environ.get('UPLOAD_EXPIRY_HOURS', 7 * 24)))
+# Expired uploads are looked for at most this often, when uploads are created
+UPLOAD_EXPIRY_CHECK_INTERVAL = 3600
+# Threads finishing streamed uploads (probe, thumbnails) while the body is still read
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', min(8, os.cpu_count() or 1)))
+
+def finish_image(file_path):
+    """Measure a stored image and write its thumbnails, returns (size, width, height)"""
+    width, height = get_image_size(file_path) or (None, None)
+    make_thumbnails(file_path, dimensions=(width, height) if width else None)
+    return os.path.getsize(file_path), width, height
+
+def try_lock(f):
+    """
+    Take an exclusive flock on an open file without waiting; it is released
+    when the file is closed. Returns False if another request holds it, in
+    this or any other worker process. Without fcntl (Windows) nothing is locked.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+def store_image(writer, file_path):
+    """Link a streamed image into place and finish it, returns (content hash, size, width, height)"""
+    content_hash = writer.commit(file_path)
+    return (content_hash,) + finish_image(file_path)
+
+class MultipartFileStream:
+    """
+    One file field of a multipart/form-data body as a readable stream,
+    decoded from the request body chunk by chunk: request.files would
+    spool the whole upload to a temporary file first. Parts before the
+    field are skipped and parts after it are never read. filename is
+    None if the body has no such field.
+    """
+    def __init__(self, stream, boundary, field='file'):
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary.encode())
+        self._buffer = bytearray()
+        self._done = False
+        self.filename = None
+
+        # The part headers, with the filename, come before any of its data
+        while True:
+            event = self._next_event()
+            if event is None:
+                self._done = True
+                break
+            if isinstance(event, File) and event.name == field:
+                self.filename = event.filename or ''
+                break
+
+    def _next_event(self):
+        """Next decoder event, reading the body as needed; None after the last part"""
+        while True:
+            event = self._decoder.next_event()
+            if isinstance(event, Epilogue):
+                return None
+            if not isinstance(event, NeedData):
+                return event
+            chunk = self._stream.read(UPLOAD_CHUNK_SIZE)
+            # A body that ends early makes the decoder raise ValueError
+            self._decoder.receive_data(chunk or None)
+
+    def read(self, size=-1):
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            event = self._next_event()
+            if isinstance(event, Data):
+                self._buffer += event.data
+                self._done = not event.more_data
+            else:
+                self._done = True
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
 
 class ProjectsController():
     def __init__(self, root) -> None:
@@ -15,6 +125,12 @@ class ProjectsController():
         if not os.path.exists(self.upload_folder):
             os.makedirs(self.upload_folder)
         
+        # Project images are hard links into uploads/blobs/
+        self.blobs = BlobStore(os.path.join(self.upload_folder, BLOB_FOLDER))
+        
+        # time.monotonic() of the last look for expired resumable uploads
+        self._uploads_expired_at = None
+        
     def get_projects(self, user_id=None):
         return self.database.get_projects(user_id)
     
@@ -24,26 +140,25 @@ class ProjectsController():
     def get_project_by_uuid(self, project_uuid, user_id=None):
         return self.database.get_project_by_uuid(project_uuid, user_id)
     
+    def get_project_with_images(self, project_uuid, user_id=None):
+        return self.database.get_project_with_images(project_uuid, user_id)
+    
     def delete_project_by_uuid(self, project_uuid, user_id=None):
-        # Get project images first to delete files
-        project = self.database.get_project_by_uuid(project_uuid, user_id)
-        if project:
+        deleted, orphaned = self.database.delete_project_by_uuid(project_uuid, user_id)
+        if deleted:
             # Delete project folder if it exists
             project_folder = os.path.join(self.upload_folder, project_uuid)
             if os.path.exists(project_folder):
-                for file in os.listdir(project_folder):
-                    file_path = os.path.join(project_folder, file)
-                    try:
-                        if os.path.isfile(file_path):
-                            os.unlink(file_path)
-                    except Exception as e:
-                        print(f"Error deleting file {file_path}: {e}")
+                # Includes the videos/ subfolder
                 try:
-                    os.rmdir(project_folder)
+                    shutil.rmtree(project_folder)
                 except Exception as e:
                     print(f"Error deleting folder {project_folder}: {e}")
+            # Blobs no image of another project references
+            for content_hash in orphaned:
+                self.blobs.release(content_hash)
         
-        return self.database.delete_project_by_uuid(project_uuid, user_id)
+        return deleted
     
     def add_project(self, data, user_id=None):
         return self.database.add_project(data, user_id)
@@ -65,11 +180,22 @@ class ProjectsController():
         new_filename = f"{uuid.uuid4()}{file_extension}"
         file_path = os.path.join(project_folder, new_filename)
         
-        # Save the file
-        file.save(file_path)
+        # Save the file, hashing it on the way into the blob store
+        writer = self.blobs.writer()
+        try:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b""):
+                writer.write(chunk)
+            content_hash = writer.commit(file_path)
+        except Exception:
+            writer.abort()
+            raise
         
         # Get file size
         file_size = os.path.getsize(file_path)
+        # Header only, the pixels are never decoded
+        width, height = get_image_size(file_path) or (None, None)
+        # Gallery tiles load these instead of the original
+        make_thumbnails(file_path, dimensions=(width, height) if width else None)
         
         # Add image to database
         relative_path = os.path.join(UPLOAD_FOLDER, project_uuid, new_filename)
@@ -78,13 +204,437 @@ class ProjectsController():
             original_filename=original_filename,
             file_path=relative_path,
             file_size=file_size,
-            user_id=user_id
+            user_id=user_id,
+            width=width,
+            height=height,
+            content_hash=content_hash
         )
         
         return image, None
     
-    def get_project_images(self, project_uuid, user_id=None):
-        return self.database.get_project_images(project_uuid, user_id)
+    def upload_images_stream(self, project_uuid, stream, boundary, allowed=None, user_id=None):
+        """
+        Store every file of a multipart/form-data body without buffering it.
+        Parts are hashed and written into the blob store while they arrive,
+        then linked into place, probed and thumbnailed on a thread pool, and
+        the whole batch is registered in one transaction with a single
+        resources update.
+        Args:
+            stream: Request body
+            boundary: Multipart boundary from the Content-Type header
+            allowed: Called with each file name, parts it rejects are skipped
+        Returns:
+            (images, rejected file names, error)
+        """
+        project = self.database.get_project_by_uuid(project_uuid, user_id)
+        if not project:
+            return None, [], "Project not found"
+        
+        project_folder = os.path.join(self.upload_folder, project_uuid)
+        os.makedirs(project_folder, exist_ok=True)
+        
+        decoder = MultipartDecoder(boundary.encode())
+        stored = []  # (original filename, relative path, future)
+        rejected = []
+        written = []  # Files to remove if the request fails
+        current = None
+        
+        try:
+            # Leaving the pool waits for every thumbnail, also when the body breaks off
+            with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    decoder.receive_data(chunk or None)
+                    event = decoder.next_event()
+                    while not isinstance(event, (Epilogue, NeedData)):
+                        if isinstance(event, File):
+                            current = None
+                            if event.filename and (allowed is None or allowed(event.filename)):
+                                new_filename = f"{uuid.uuid4()}{os.path.splitext(event.filename)[1]}"
+                                file_path = os.path.join(project_folder, new_filename)
+                                written.append(file_path)
+                                current = (event.filename, new_filename, self.blobs.writer())
+                            elif event.filename:
+                                rejected.append(event.filename)
+                        elif isinstance(event, Data) and current:
+                            original_filename, new_filename, writer = current
+                            writer.write(event.data)
+                            if not event.more_data:
+                                current = None
+                                stored.append((
+                                    original_filename,
+                                    os.path.join(UPLOAD_FOLDER, project_uuid, new_filename),
+                                    pool.submit(store_image, writer,
+                                                os.path.join(project_folder, new_filename))
+                                ))
+                        event = decoder.next_event()
+                    if not chunk:
+                        break
+            
+            images = []
+            for original_filename, relative_path, future in stored:
+                content_hash, file_size, width, height = future.result()
+                images.append({
+                    "original_filename": original_filename,
+                    "file_path": relative_path,
+                    "file_size": file_size,
+                    "width": width,
+                    "height": height,
+                    "content_hash": content_hash
+                })
+            images = self.database.add_project_images(project_uuid, images, user_id)
+            if images is None:
+                raise ValueError("Project not found")
+        except Exception as e:
+            if current:
+                current[2].abort()
+            for file_path in written:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                remove_thumbnails(file_path)
+            self.database.session.rollback()
+            self.release_blobs(future.result()[0] for _, _, future in stored if not future.exception())
+            # Truncated or malformed body
+            if isinstance(e, ValueError):
+                return None, rejected, f"Upload failed: {e}"
+            raise
+        
+        return images, rejected, None
+    
+    # Resumable uploads: create, append chunks at the current offset, complete.
+    # Methods return (body, status code) like AuthController. Chunk writes,
+    # completion and expiry hold a flock on the staging file, so they are
+    # serialized across worker processes too.
+    def _staging_path(self, upload):
+        return os.path.join(self.upload_folder, upload["project_uuid"], STAGING_FOLDER, f"{upload['uuid']}.part")
+    
+    def _open_staging(self, upload):
+        """
+        Open and lock the staging file of an upload.
+        Returns (file, error body, status code); the file is None on error.
+        """
+        path = self._staging_path(upload)
+        try:
+            f = open(path, "r+b")
+        except FileNotFoundError:
+            return None, {"error": "Upload data is gone"}, 410
+        if not try_lock(f):
+            f.close()
+            return None, {"error": "Another request is writing to this upload"}, 409
+        # Completion may have moved the file away while we waited to open it
+        try:
+            moved = not os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            f.close()
+            return None, {"error": "Upload is no longer being uploaded"}, 409
+        return f, None, None
+    
+    def _upload_state(self, upload):
+        """Upload as returned to clients; the offset is the length of the staging file"""
+        state = dict(upload)
+        if upload["status"] == "completed":
+            state["offset"] = upload["size"]
+        else:
+            path = self._staging_path(upload)
+            state["offset"] = os.path.getsize(path) if os.path.exists(path) else None
+        return state
+    
+    def create_upload(self, project_uuid, filename, kind, size, user_id=None):
+        project = self.database.get_project_by_uuid(project_uuid, user_id)
+        if not project:
+            return {"error": "Project not found"}, 404
+        
+        now = time.monotonic()
+        if self._uploads_expired_at is None or now - self._uploads_expired_at > UPLOAD_EXPIRY_CHECK_INTERVAL:
+            self._uploads_expired_at = now
+            self.expire_uploads()
+        
+        upload = self.database.add_upload(project_uuid, filename, kind, size, user_id)
+        path = self._staging_path(upload)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "wb").close()
+        
+        return self._upload_state(upload), 201
+    
+    def get_upload(self, upload_uuid, user_id=None):
+        upload = self.database.get_upload(upload_uuid, user_id)
+        if not upload:
+            return {"error": "Upload not found"}, 404
+        return self._upload_state(upload), 200
+    
+    def write_upload_chunk(self, upload_uuid, offset, stream, user_id=None):
+        """
+        Append the request body to the staging file. The chunk must start
+        at the current offset; bytes of a chunk cut off by a dropped
+        connection are kept, and the client resumes from the new offset.
+        """
+        upload = self.database.get_upload(upload_uuid, user_id)
+        if not upload:
+            return {"error": "Upload not found"}, 404
+        if upload["status"] != "uploading":
+            return {"error": f"Upload is {upload['status']}"}, 409
+        
+        f, error, status_code = self._open_staging(upload)
+        if error:
+            return error, status_code
+        with f:
+            # The offset is checked and the chunk appended under the lock
+            current = f.seek(0, os.SEEK_END)
+            if offset != current:
+                return {"error": "Offset mismatch", "offset": current}, 409
+            
+            remaining = upload["size"] - current
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(chunk) > remaining:
+                    # Drop the whole chunk, the offset stays where it was
+                    f.flush()
+                    f.truncate(current)
+                    return {"error": "Chunk goes past the declared upload size", "offset": current}, 413
+                f.write(chunk)
+                remaining -= len(chunk)
+        
+        return self._upload_state(upload), 200
+    
+    def complete_upload(self, upload_uuid, user_id=None, finish=None):
+        """
+        Turn a fully received upload into a project file. The staging file is
+        renamed into place, so the file appears complete or not at all:
+        images are registered in the gallery, videos and archives land in
+        their folders. finish(upload, result) may add to the result, e.g. a job.
+        Completing an already completed upload returns it unchanged.
+        """
+        upload = self.database.get_upload(upload_uuid, user_id)
+        if not upload:
+            return {"error": "Upload not found"}, 404
+        if upload["status"] == "completed":
+            return self._upload_state(upload), 200
+        
+        f, error, status_code = self._open_staging(upload)
+        if error:
+            return error, status_code
+        with f:
+            received = os.fstat(f.fileno()).st_size
+            if received != upload["size"]:
+                return {"error": "Upload is incomplete", "offset": received}, 409
+            if not self.database.claim_upload(upload_uuid):
+                return {"error": "Upload is already being completed"}, 409
+            
+            project_uuid = upload["project_uuid"]
+            extension = os.path.splitext(upload["filename"])[1].lower()
+            staging_path = self._staging_path(upload)
+            try:
+                if upload["kind"] in ("video", "archive"):
+                    folder = VIDEO_FOLDER if upload["kind"] == "video" else ARCHIVE_FOLDER
+                    os.makedirs(os.path.join(self.upload_folder, project_uuid, folder), exist_ok=True)
+                    new_filename = f"{uuid.uuid4()}{extension}"
+                    os.replace(staging_path, os.path.join(self.upload_folder, project_uuid, folder, new_filename))
+                    result = {f"{upload['kind']}_path": os.path.join(UPLOAD_FOLDER, project_uuid, folder, new_filename)}
+                else:
+                    new_filename = f"{uuid.uuid4()}{extension}"
+                    file_path = os.path.join(self.upload_folder, project_uuid, new_filename)
+                    content_hash = self.blobs.store_file(staging_path, file_path)
+                    file_size, width, height = finish_image(file_path)
+                    images = self.database.add_project_images(project_uuid, [{
+                        "original_filename": upload["filename"],
+                        "file_path": os.path.join(UPLOAD_FOLDER, project_uuid, new_filename),
+                        "file_size": file_size,
+                        "width": width,
+                        "height": height,
+                        "content_hash": content_hash
+                    }], upload["user_id"])
+                    if images is None:
+                        raise ValueError(f"Project with UUID {project_uuid} not found")
+                    result = {"image": images[0]}
+                
+                if finish:
+                    result.update(finish(upload, result) or {})
+            except Exception:
+                # Still resumable as long as the data wasn't moved yet
+                status = "uploading" if os.path.exists(staging_path) else "failed"
+                self.database.update_upload(upload_uuid, status=status)
+                raise
+            
+            upload = self.database.update_upload(upload_uuid, status="completed", result=result,
+                                                 completed_at=str(datetime.datetime.now()))
+        
+        return self._upload_state(upload), 200
+    
+    def abort_upload(self, upload_uuid, user_id=None):
+        upload = self.database.get_upload(upload_uuid, user_id)
+        if not upload:
+            return {"error": "Upload not found"}, 404
+        if upload["status"] == "completing":
+            return {"error": "Upload is being completed"}, 409
+        
+        if upload["status"] != "completed":
+            f, error, status_code = self._open_staging(upload)
+            if f is None and status_code != 410:
+                return error, status_code
+            if f:
+                with f:
+                    os.remove(self._staging_path(upload))
+        self.database.delete_upload(upload_uuid)
+        return {"message": "Upload deleted"}, 200
+    
+    def expire_uploads(self, max_age=UPLOAD_EXPIRY):
+        """
+        Delete resumable uploads that were never completed or deleted and
+        received no chunk for max_age, with their staging files.
+        Returns the number of uploads deleted.
+        """
+        cutoff = datetime.datetime.now() - max_age
+        expired = 0
+        for upload in self.database.get_stale_uploads(str(cutoff)):
+            path = self._staging_path(upload)
+            if os.path.exists(path):
+                if datetime.datetime.fromtimestamp(os.path.getmtime(path)) > cutoff:
+                    continue  # Still receiving chunks
+                f, _, status_code = self._open_staging(upload)
+                if f is None and status_code != 410:
+                    continue  # A chunk is being written right now
+                if f:
+                    with f:
+                        os.remove(path)
+            self.database.delete_upload(upload["uuid"])
+            expired += 1
+        return expired
+    
+    def save_video(self, project_uuid, stream, filename):
+        """
+        Stream an uploaded video to uploads/<project>/videos/ chunk by chunk.
+        Returns the path relative to root.
+        """
+        return self._save_stream(project_uuid, VIDEO_FOLDER, stream, filename)
+    
+    def save_archive(self, project_uuid, stream, filename):
+        """Stream an uploaded dataset archive to uploads/<project>/archives/"""
+        return self._save_stream(project_uuid, ARCHIVE_FOLDER, stream, filename)
+    
+    def _save_stream(self, project_uuid, folder, stream, filename):
+        target_folder = os.path.join(self.upload_folder, project_uuid, folder)
+        os.makedirs(target_folder, exist_ok=True)
+        
+        new_filename = f"{uuid.uuid4()}{os.path.splitext(filename)[1].lower()}"
+        file_path = os.path.join(target_folder, new_filename)
+        
+        # Write to a temp name so a broken upload never looks complete
+        tmp_path = file_path + ".part"
+        try:
+            with open(tmp_path, "wb") as f:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            os.replace(tmp_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        return os.path.join(UPLOAD_FOLDER, project_uuid, folder, new_filename)
+    
+    def add_project_images(self, project_uuid, images, user_id=None):
+        return self.database.add_project_images(project_uuid, images, user_id)
+    
+    def backfill_image_dimensions(self, batch_size=BACKFILL_BATCH_SIZE):
+        """
+        Record width/height of images uploaded before they were stored.
+        Returns (updated, unreadable) counts; unreadable images stay NULL.
+        """
+        updated = unreadable = 0
+        after = 0
+        while True:
+            images = self.database.get_images_without_dimensions(after, batch_size)
+            if not images:
+                break
+            dimensions = []
+            for image in images:
+                size = get_image_size(os.path.join(self.root, image["file_path"]))
+                if size:
+                    dimensions.append({"id": image["id"], "width": size[0], "height": size[1]})
+                else:
+                    unreadable += 1
+            updated += self.database.set_image_dimensions(dimensions)
+            after = images[-1]["id"]
+        return updated, unreadable
+    
+    def deduplicate_images(self, batch_size=BACKFILL_BATCH_SIZE):
+        """
+        Move images stored before the blob store existed into it: each file
+        is hashed and either becomes its content's blob or is replaced by a
+        link to the existing one.
+        Returns (hashed, deduplicated, freed bytes, missing) counts.
+        """
+        hashed = deduplicated = freed = missing = 0
+        after = 0
+        while True:
+            images = self.database.get_images_without_hash(after, batch_size)
+            if not images:
+                break
+            hashes = []
+            for image in images:
+                file_path = os.path.join(self.root, image["file_path"])
+                if not os.path.isfile(file_path):
+                    missing += 1
+                    continue
+                file_size = os.path.getsize(file_path)
+                content_hash, linked = self.blobs.adopt(file_path)
+                hashes.append({"id": image["id"], "content_hash": content_hash})
+                if linked:
+                    deduplicated += 1
+                    freed += file_size
+            hashed += self.database.set_image_hashes(hashes)
+            after = images[-1]["id"]
+        return hashed, deduplicated, freed, missing
+    
+    def get_thumbnail(self, filename, size):
+        """
+        Absolute path of the thumbnail of uploads/<filename> at the given
+        size. Images uploaded before thumbnails existed get theirs generated
+        on first request and persisted. Returns None if the original is
+        missing or can't be decoded.
+        """
+        if size not in THUMBNAIL_SIZES:
+            return None
+        image_path = safe_join(self.upload_folder, filename)
+        if not image_path or not os.path.isfile(image_path):
+            return None
+        
+        path = thumbnail_path(image_path, size)
+        if not os.path.exists(path):
+            path = make_thumbnails(image_path).get(size)
+        return path
+    
+    def get_project_images(self, project_uuid, user_id=None, limit=None, after=None,
+                           order="asc", annotated=None, label_id=None):
+        return self.database.get_project_images(
+            project_uuid, user_id, limit=limit, after=after, order=order,
+            annotated=annotated, label_id=label_id
+        )
+        
+    def get_project_images_page(self, project_uuid, user_id=None, limit=100, after=None,
+                                order="asc", annotated=None, label_id=None):
+        """
+        One keyset page of project images.
+        Returns:
+            Tuple of (images, next_cursor); next_cursor is the `after` of the
+            following page, or None on the last page
+        """
+        # Fetch one extra row to know whether another page follows
+        images = self.get_project_images(
+            project_uuid, user_id, limit=limit + 1, after=after, order=order,
+            annotated=annotated, label_id=label_id
+        )
+        if len(images) > limit:
+            images = images[:limit]
+            return images, images[-1]["id"]
+        return images, None
         
     def delete_image(self, image_uuid, user_id=None):
         # Get the image first to check ownership and get file path
@@ -98,20 +648,29 @@ class ProjectsController():
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
+            remove_thumbnails(file_path)
         except Exception as e:
             print(f"Error deleting file {file_path}: {e}")
             return False, f"Error deleting file: {str(e)}"
         
         # Delete the image from database
-        success = self.database.delete_image(image_uuid, user_id)
+        success, orphaned = self.database.delete_image(image_uuid, user_id)
         
         if success:
+            # The blob goes with the last image row referencing it
+            for content_hash in orphaned:
+                self.blobs.release(content_hash)
             # Update project resources count
             self.database.update_project_resources_count(image['project_uuid'])
             return True, "Image deleted successfully"
         else:
             return False, "Failed to delete image from database"
 
+    def release_blobs(self, content_hashes):
+        """Drop the blobs of files that were stored but never registered, unless an image uses them"""
+        for content_hash in self.database.get_unreferenced_hashes(content_hashes):
+            self.blobs.release(content_hash)
+
     def get_project_labels(self, project_uuid):
         """Get all labels for a project"""
         return self.database.get_project_labels(project_uuid)
@@ -128,10 +687,18 @@ class ProjectsController():
         """Get all annotations for an image"""
         return self.database.get_image_annotations(image_uuid)
 
+    def get_project_annotations(self, project_uuid, user_id=None):
+        """Get all annotations of a project grouped by image uuid"""
+        return self.database.get_project_annotations(project_uuid, user_id)
+
     def add_annotation(self, image_uuid, label_id, x, y, width, height):
         """Add a new annotation to an image"""
         return self.database.add_annotation(image_uuid, label_id, x, y, width, height)
 
+    def save_annotations(self, create=(), update=(), delete=(), user_id=None):
+        """Create, update and delete many annotations in one transaction"""
+        return self.database.save_annotations(create, update, delete, user_id)
+
     def delete_annotation(self, image_uuid, annotation_id):
         """Delete an annotation from an image"""
         return self.database.delete_annotation(image_uuid, annotation_id)
\ No newline at end of file
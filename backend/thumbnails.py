@@ -0,0 +1,84 @@
+import cv2
+import os
+import uuid
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    from image_probe import get_image_size
+except ImportError:
+    # Imported from the repository root (scripts, test.py)
+    from backend.image_probe import get_image_size
+
+# Thumbnails live next to the originals: uploads/<project>/thumbs/<size>/<name>.jpg
+THUMBNAIL_FOLDER = "thumbs"
+# Longest side in pixels of each generated thumbnail
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', 85))
+
+# JPEG decoders can scale by 1/2, 1/4 or 1/8 while decoding, which skips most
+# of the work for large originals
+REDUCED_READ_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                      (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def thumbnail_path(image_path: str, size: int) -> str:
+    """Path of the thumbnail of an original image at the given size"""
+    folder, filename = os.path.split(image_path)
+    name = os.path.splitext(filename)[0] + ".jpg"
+    return os.path.join(folder, THUMBNAIL_FOLDER, str(size), name)
+
+def make_thumbnails(image_path: str, sizes: Iterable[int] = THUMBNAIL_SIZES,
+                    dimensions: Optional[Tuple[int, int]] = None) -> Dict[int, str]:
+    """
+    Decode an image once and write a thumbnail for every size, largest first,
+    each one scaled down from the previous. Files are written under a temp
+    name and renamed, so concurrent requests never see a partial thumbnail.
+    Args:
+        image_path: Path to the original image
+        sizes: Longest sides of the thumbnails to write
+        dimensions: (width, height) of the original if known, read from the header otherwise
+    Returns:
+        Dictionary of size -> thumbnail path, empty if the image can't be decoded
+    """
+    sizes = sorted(set(sizes), reverse=True)
+    if not sizes:
+        return {}
+
+    flag = cv2.IMREAD_COLOR
+    dimensions = dimensions or get_image_size(image_path)
+    if dimensions:
+        for factor, reduced_flag in REDUCED_READ_FLAGS:
+            if max(dimensions) // factor >= sizes[0]:
+                flag = reduced_flag
+                break
+
+    image = cv2.imread(image_path, flag)
+    if image is None:
+        return {}
+
+    paths = {}
+    for size in sizes:
+        height, width = image.shape[:2]
+        scale = size / max(width, height)
+        if scale < 1:
+            image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+
+        ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+        if not ok:
+            continue
+        path = thumbnail_path(image_path, size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data.tobytes())
+        os.replace(tmp_path, path)
+        paths[size] = path
+
+    return paths
+
+def remove_thumbnails(image_path: str) -> None:
+    """Delete every thumbnail of an original image"""
+    for size in THUMBNAIL_SIZES:
+        path = thumbnail_path(image_path, size)
+        if os.path.exists(path):
+            os.remove(path)
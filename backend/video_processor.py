@@ -1,7 +1,93 @@
 import cv2
+import numpy as np
 import os
-from typing import List, Optional
+import itertools
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from typing import Callable, Iterator, List, Optional, Tuple
 from datetime import datetime
+try:
+    from image_probe import get_image_size
+except ImportError:
+    from backend.image_probe import get_image_size
+
+# Gaps between wanted frames up to this many frames are skipped with grab(),
+# which demuxes and decodes but skips the pixel conversion and copy of read().
+# Longer gaps seek, jumping to the nearest keyframe instead of decoding every frame.
+SEEK_THRESHOLD = 300
+
+# Smallest number of frames worth handing to a separate decoding process
+MIN_CHUNK_FRAMES = 50
+# Ranges per decoding process; smaller ranges stream out sooner
+CHUNKS_PER_WORKER = 4
+
+# Side of the grid a frame is reduced to for its difference hash (8x8 = 64 bits)
+HASH_SIZE = 8
+
+def frame_hash(frame) -> np.ndarray:
+    """
+    Difference hash of a frame: downscale to a (HASH_SIZE+1)xHASH_SIZE gray
+    thumbnail and compare horizontally adjacent pixels. Near-identical frames
+    differ in only a few of the HASH_SIZE**2 bits, regardless of exposure drift.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    return small[:, 1:] > small[:, :-1]
+
+# Threads encoding and writing frames while the decoder keeps going
+ENCODER_THREADS = min(8, os.cpu_count() or 1)
+
+# Output formats: file extension, OpenCV quality flag and its default
+IMAGE_FORMATS = {
+    'jpg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 95),
+    'png': ('.png', cv2.IMWRITE_PNG_COMPRESSION, 3),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 90),
+}
+
+class FrameWriter:
+    """
+    Encodes and writes frames on a thread pool so the decoder never waits
+    for compression or disk I/O. At most max_pending frames are queued:
+    submit() blocks beyond that, which keeps memory bounded.
+    cv2.imwrite releases the GIL, so the threads encode in parallel.
+    """
+    def __init__(self, image_format: str = 'jpg', quality: Optional[int] = None,
+                 threads: int = ENCODER_THREADS, max_pending: Optional[int] = None):
+        image_format = 'jpg' if image_format == 'jpeg' else image_format
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+
+        self.extension, flag, default_quality = IMAGE_FORMATS[image_format]
+        # For PNG the value is the zlib compression level (0-9)
+        self.params = [flag, default_quality if quality is None else int(quality)]
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._slots = threading.BoundedSemaphore(max_pending or threads * 2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write(self, frame, path: str) -> str:
+        if not cv2.imwrite(path, frame, self.params):
+            raise ValueError(f"Could not write frame: {path}")
+        return path
+
+    def submit(self, frame, path: str) -> Future:
+        """Queue a frame for writing; the future resolves to its path"""
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._write, frame, path)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
 
 class VideoProcessor:
     def __init__(self, video_path: str, output_dir: str):
@@ -14,6 +100,8 @@ class VideoProcessor:
         self.video_path = video_path
         self.output_dir = output_dir
         self.cap = None
+        # Counts of the last extract_frames() call
+        self.stats = {'decoded': 0, 'kept': 0, 'dropped': 0}
         
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
@@ -47,71 +135,301 @@ class VideoProcessor:
             'duration': int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT) / self.cap.get(cv2.CAP_PROP_FPS))
         }
 
-    def extract_frames(self, max_frames: Optional[int] = None, frame_interval: int = 1) -> List[str]:
+    def frame_indices(self, frame_interval: int = 1, target_fps: Optional[float] = None,
+                      start_time: Optional[float] = None, end_time: Optional[float] = None) -> Iterator[int]:
+        """
+        Indices of the frames to extract, in increasing order.
+        Args:
+            frame_interval: Take every nth frame (ignored when target_fps is set)
+            target_fps: Sample this many frames per second of video
+            start_time: First second of the range to extract (None for the start)
+            end_time: Last second of the range, exclusive (None for the end)
+        """
+        if not self.cap:
+            raise ValueError("Video capture not initialized")
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if (target_fps or start_time or end_time is not None) and not fps:
+            raise ValueError(f"Unknown frame rate, can't sample by time: {self.video_path}")
+
+        start = int(round(start_time * fps)) if start_time else 0
+        # The frame count is an estimate for some containers; when it is
+        # missing, reading simply stops at the end of the stream
+        end = total_frames if total_frames > 0 else None
+        if end_time is not None:
+            end = int(round(end_time * fps)) if end is None else min(end, int(round(end_time * fps)))
+
+        if target_fps:
+            step = max(fps / target_fps, 1.0)
+            indices = (start + int(round(k * step)) for k in itertools.count())
+        else:
+            indices = itertools.count(start, max(frame_interval, 1))
+        return itertools.takewhile(lambda index: end is None or index < end, indices)
+
+    def read_frames(self, indices, seek_threshold: int = SEEK_THRESHOLD) -> Iterator[Tuple[int, object]]:
         """
-        Extract frames from the video.
+        Decode only the wanted frames.
+        Args:
+            indices: Increasing frame indices, e.g. from frame_indices()
+            seek_threshold: Largest gap skipped with grab(); longer gaps seek
+        Returns:
+            Iterator of (frame index, frame) tuples
+        """
+        if not self.cap:
+            raise ValueError("Video capture not initialized")
+
+        # Index of the frame the next read() returns
+        position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        for index in indices:
+            gap = index - position
+            if gap < 0 or gap > seek_threshold:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            else:
+                for _ in range(gap):
+                    if not self.cap.grab():  # End of video
+                        return
+
+            ret, frame = self.cap.read()
+            if not ret:  # End of video
+                return
+            position = index + 1
+            yield index, frame
+
+    def iter_frames(self, max_frames: Optional[int] = None, frame_interval: int = 1,
+                    target_fps: Optional[float] = None, start_time: Optional[float] = None,
+                    end_time: Optional[float] = None, seek_threshold: int = SEEK_THRESHOLD,
+                    workers: int = 1, image_format: str = 'jpg', quality: Optional[int] = None,
+                    dedup_threshold: Optional[int] = None,
+                    progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Iterator[dict]:
+        """
+        Extract frames from the video, yielding each one as soon as it is on
+        disk so later stages can start before the whole video is decoded.
+        Skipped frames are never fully decoded: short gaps are passed with
+        grab() and long ones with a seek.
+        With workers > 1 the wanted frames are split into contiguous ranges,
+        each decoded by its own process and VideoCapture, and handed out range
+        by range as they complete. Frame names depend only on the frame index,
+        so the output is the same either way.
+        With dedup_threshold set, frames whose difference hash is within that
+        many bits of the last kept frame are dropped before encoding. Parallel
+        ranges report the hash of every decoded frame and the decisions are
+        redone here in frame order, so ranges start from the last frame kept
+        before them. Counts end up in self.stats.
         Args:
             max_frames: Maximum number of frames to extract (None for all frames)
             frame_interval: Extract every nth frame (1 for every frame)
+            target_fps: Extract this many frames per second instead of every nth frame
+            start_time: Start of the time range in seconds (None for the start)
+            end_time: End of the time range in seconds (None for the end)
+            seek_threshold: Largest gap in frames skipped with grab() before seeking
+            workers: Number of decoding processes
+            image_format: Output format, 'jpg', 'png' or 'webp'
+            quality: JPEG/WebP quality (0-100) or PNG compression level (0-9)
+            dedup_threshold: Largest hash distance (0-64 bits) treated as a duplicate, None to keep all
+            progress: Called as progress(decoded, total) while decoding; total is
+                None when the video doesn't report its frame count
         Returns:
-            List of paths to the extracted frame images
+            Iterator of frame dicts (index, timestamp in seconds, path, width, height), in frame order
         """
         if not self.cap:
             raise ValueError("Video capture not initialized")
 
-        frame_paths = []
-        frame_count = 0
-        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
         # Generate timestamp for this batch
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:  # End of video
-                break
 
-            # Skip frames based on interval
-            if frame_count % frame_interval != 0:
-                frame_count += 1
-                continue
+        indices = self.frame_indices(frame_interval, target_fps, start_time, end_time)
+        if max_frames:
+            indices = itertools.islice(indices, max_frames)
+
+        encoding = {'image_format': image_format, 'quality': quality}
+        self.stats = {'decoded': 0, 'kept': 0, 'dropped': 0}
+
+        # With a frame count the plan is finite and cheap to hold
+        total = None
+        if self.cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0:
+            indices = list(indices)
+            total = len(indices)
+
+        if workers > 1 and total:
+            # Several ranges per process, so frames come back while the rest decodes
+            chunks = self._split_indices(indices, workers * CHUNKS_PER_WORKER)
+            if len(chunks) > 1:
+                processes = min(workers, len(chunks))
+                # Share the encoder threads between the decoding processes
+                encoding['threads'] = max(1, ENCODER_THREADS // processes)
+                return self._iter_chunks(chunks, timestamp, seek_threshold, encoding,
+                                         dedup_threshold, processes, progress, total)
 
-            # Check if we've reached the maximum number of frames
-            if max_frames and len(frame_paths) >= max_frames:
-                break
+        return self._iter_saved_frames(indices, timestamp, seek_threshold, encoding,
+                                       dedup_threshold, progress, total)
 
-            # Generate frame filename
-            frame_filename = f"frame_{timestamp}_{frame_count:06d}.jpg"
-            frame_path = os.path.join(self.output_dir, frame_filename)
+    def extract_frames(self, max_frames: Optional[int] = None, frame_interval: int = 1,
+                       target_fps: Optional[float] = None, start_time: Optional[float] = None,
+                       end_time: Optional[float] = None, seek_threshold: int = SEEK_THRESHOLD,
+                       workers: int = 1, image_format: str = 'jpg', quality: Optional[int] = None,
+                       dedup_threshold: Optional[int] = None,
+                       progress: Optional[Callable[[int, Optional[int]], None]] = None) -> List[str]:
+        """
+        Extract frames from the video. Same arguments as iter_frames().
+        Returns:
+            List of paths to the extracted frame images, in frame order
+        """
+        return [frame['path'] for frame in self.iter_frames(
+            max_frames, frame_interval, target_fps, start_time, end_time, seek_threshold,
+            workers, image_format, quality, dedup_threshold, progress
+        )]
+
+    @staticmethod
+    def _split_indices(indices: List[int], workers: int) -> List[List[int]]:
+        """Split frame indices into contiguous, equally sized chunks"""
+        count = max(1, min(workers, len(indices) // MIN_CHUNK_FRAMES))
+        size, extra = divmod(len(indices), count)
+        chunks = []
+        start = 0
+        for i in range(count):
+            end = start + size + (1 if i < extra else 0)
+            chunks.append(indices[start:end])
+            start = end
+        return chunks
+
+    def _iter_chunks(self, chunks: List[List[int]], timestamp: str, seek_threshold: int, encoding: dict,
+                     dedup_threshold: Optional[int], processes: int, progress, total: int) -> Iterator[dict]:
+        pool = ProcessPoolExecutor(max_workers=processes)
+        try:
+            # map() keeps chunk order, so frames come out in frame order
+            last_hash = None
+            for chunk_frames, chunk_stats, chunk_hashes in pool.map(
+                    _extract_chunk,
+                    itertools.repeat(self.video_path), itertools.repeat(self.output_dir),
+                    chunks, itertools.repeat(timestamp), itertools.repeat(seek_threshold),
+                    itertools.repeat(encoding), itertools.repeat(dedup_threshold)):
+                self.stats['decoded'] += chunk_stats['decoded']
+                if progress:
+                    progress(self.stats['decoded'], total)
+                if dedup_threshold is None:
+                    self.stats['kept'] += chunk_stats['kept']
+                    yield from chunk_frames
+                    continue
+
+                # The range deduplicated from its own first frame; redo it from
+                # the last frame kept before the range
+                saved = {frame['index']: frame for frame in chunk_frames}
+                for index, current_hash in chunk_hashes:
+                    frame = saved.get(index)
+                    if last_hash is not None and \
+                            np.count_nonzero(np.unpackbits(current_hash ^ last_hash)) <= dedup_threshold:
+                        self.stats['dropped'] += 1
+                        if frame:  # Kept only because the range started with it
+                            os.remove(frame['path'])
+                        continue
+                    last_hash = current_hash
+                    self.stats['kept'] += 1
+                    # Dropped by the range against a frame that isn't kept here
+                    yield frame or self._save_frame(index, timestamp, encoding)
+        finally:
+            # Don't start the remaining ranges if the consumer stopped early
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _save_frame(self, index: int, timestamp: str, encoding: dict) -> dict:
+        """Decode and write a single frame on this process"""
+        for frame_count, frame in self.read_frames([index]):
+            with FrameWriter(**dict(encoding, threads=1)) as writer:
+                frame_path = os.path.join(self.output_dir, f"frame_{timestamp}_{frame_count:06d}{writer.extension}")
+                writer.submit(frame, frame_path).result()
+            return self._frame_info(frame_count, frame_path, frame)
+        raise ValueError(f"Could not decode frame {index}")
 
-            # Save frame as JPEG
-            cv2.imwrite(frame_path, frame)
-            frame_paths.append(frame_path)
+    def _frame_info(self, frame_count: int, frame_path: str, frame) -> dict:
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        return {
+            'index': frame_count,
+            'timestamp': frame_count / fps if fps else None,
+            'path': frame_path,
+            'width': frame.shape[1],
+            'height': frame.shape[0]
+        }
+
+    def _iter_saved_frames(self, indices, timestamp: str, seek_threshold: int = SEEK_THRESHOLD,
+                           encoding: Optional[dict] = None, dedup_threshold: Optional[int] = None,
+                           progress=None, total: Optional[int] = None,
+                           hashes: Optional[list] = None) -> Iterator[dict]:
+        pending = deque()
+        last_hash = None
+
+        # Decode on this thread, encode and write on the writer's threads
+        with FrameWriter(**(encoding or {})) as writer:
+            for frame_count, frame in self.read_frames(indices, seek_threshold):
+                self.stats['decoded'] += 1
+                if progress:
+                    progress(self.stats['decoded'], total)
 
-            frame_count += 1
+                # Drop frames that barely differ from the last kept one
+                if dedup_threshold is not None:
+                    current_hash = frame_hash(frame)
+                    if hashes is not None:
+                        hashes.append((frame_count, np.packbits(current_hash)))
+                    if last_hash is not None and \
+                            np.count_nonzero(current_hash != last_hash) <= dedup_threshold:
+                        self.stats['dropped'] += 1
+                        continue
+                    last_hash = current_hash
+                self.stats['kept'] += 1
+                # Generate frame filename
+                frame_filename = f"frame_{timestamp}_{frame_count:06d}{writer.extension}"
+                frame_path = os.path.join(self.output_dir, frame_filename)
 
-            # Optional: yield progress
-            if frame_count % 100 == 0:
-                progress = (frame_count / total_frames) * 100
-                print(f"Processing: {progress:.1f}% complete")
+                pending.append((writer.submit(frame, frame_path),
+                                self._frame_info(frame_count, frame_path, frame)))
 
-        return frame_paths
+                # Hand out the frames already written, in order
+                while pending and pending[0][0].done():
+                    future, info = pending.popleft()
+                    future.result()  # Raises the write error, if any
+                    yield info
+
+            while pending:
+                future, info = pending.popleft()
+                future.result()
+                yield info
 
     @staticmethod
     def get_frame_dimensions(frame_path: str) -> tuple:
         """
-        Get the dimensions of a frame.
+        Get the dimensions of a frame from its file header, decoding it
+        only if the format isn't one get_image_size() understands.
         Args:
             frame_path: Path to the frame image
         Returns:
             Tuple of (width, height)
         """
+        size = get_image_size(frame_path)
+        if size:
+            return size
         img = cv2.imread(frame_path)
         if img is None:
             raise ValueError(f"Could not read image: {frame_path}")
         return img.shape[1], img.shape[0]  # OpenCV returns (height, width, channels)
 
-def process_video(video_path: str, output_dir: str, max_frames: Optional[int] = None, frame_interval: int = 1) -> List[str]:
+def _extract_chunk(video_path: str, output_dir: str, indices: List[int], timestamp: str,
+                   seek_threshold: int, encoding: dict,
+                   dedup_threshold: Optional[int]) -> Tuple[List[dict], dict, list]:
+    """Worker process entry point: decode one range of frames"""
+    hashes = []  # (index, packed hash) of every decoded frame, for dedup across ranges
+    with VideoProcessor(video_path, output_dir) as processor:
+        frames = list(processor._iter_saved_frames(indices, timestamp, seek_threshold, encoding,
+                                                   dedup_threshold, hashes=hashes))
+        return frames, processor.stats, hashes
+
+def print_progress(done: int, total: Optional[int]) -> None:
+    """Progress callback for iter_frames() that logs every 100 decoded frames"""
+    if done % 100 == 0 or done == total:
+        print(f"Processing: {done}/{total or '?'} frames")
+
+def process_video(video_path: str, output_dir: str, max_frames: Optional[int] = None, frame_interval: int = 1,
+                  target_fps: Optional[float] = None, start_time: Optional[float] = None,
+                  end_time: Optional[float] = None, workers: int = 1,
+                  dedup_threshold: Optional[int] = None) -> List[str]:
     """
     Convenience function to process a video file.
     Args:
@@ -119,6 +437,11 @@ def process_video(video_path: str, output_dir: str, max_frames: Optional[int] =
         output_dir: Directory where frames will be saved
         max_frames: Maximum number of frames to extract (None for all frames)
         frame_interval: Extract every nth frame (1 for every frame)
+        target_fps: Extract this many frames per second instead of every nth frame
+        start_time: Start of the time range in seconds (None for the start)
+        end_time: End of the time range in seconds (None for the end)
+        workers: Number of decoding processes
+        dedup_threshold: Largest hash distance treated as a near-duplicate frame (None to keep all)
     Returns:
         List of paths to the extracted frame images
     """
@@ -127,7 +450,9 @@ def process_video(video_path: str, output_dir: str, max_frames: Optional[int] =
         print(f"Processing video: {os.path.basename(video_path)}")
         print(f"Video info: {video_info}")
         
-        frame_paths = processor.extract_frames(max_frames, frame_interval)
-        print(f"Extracted {len(frame_paths)} frames")
+        frame_paths = processor.extract_frames(max_frames, frame_interval, target_fps, start_time, end_time,
+                                               workers=workers, dedup_threshold=dedup_threshold,
+                                               progress=print_progress)
+        print(f"Extracted {len(frame_paths)} frames ({processor.stats['dropped']} near-duplicates dropped)")
         
         return frame_paths 
\ No newline at end of file
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other by plain name, as when app.py runs from backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from database.models import DBSession
+from proejcts import ProjectsController
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Fresh working directory, so every test gets its own db.sqlite and uploads/"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def database(workdir):
+    """Session on the working directory's database"""
+    database = DBSession("db.sqlite")
+    yield database
+    database.destuctor()
+
+@pytest.fixture
+def projects(workdir, database):
+    """ProjectsController keeping its uploads in the working directory"""
+    return ProjectsController(str(workdir))
+
+@pytest.fixture
+def project_uuid(database):
+    """An empty project"""
+    database.add_project({"name": "p", "description": "d"})
+    return database.get_projects()[-1]["uuid"]
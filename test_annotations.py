@@ -0,0 +1,56 @@
+import pytest
+
+@pytest.fixture
+def db(database, project_uuid):
+    image = database.add_project_image(project_uuid, "a.png", "uploads/a.png", 1)
+    label, _ = database.add_label(project_uuid, "cat")
+    return database, image, label
+
+def box(image, label, **fields):
+    return dict({"image_uuid": image["uuid"], "label_id": label["id"],
+                 "x": 0.1, "y": 0.2, "width": 0.3, "height": 0.4}, **fields)
+
+def test_batch_creates_updates_and_deletes(db):
+    database, image, label = db
+    result, error = database.save_annotations(create=[box(image, label), box(image, label)])
+    assert error is None
+    first, second = result[image["uuid"]]
+
+    result, error = database.save_annotations(update=[{"id": first["id"], "x": 0.5}], delete=[second["id"]])
+    assert error is None
+    assert [(a["id"], a["x"]) for a in result[image["uuid"]]] == [(first["id"], 0.5)]
+
+def test_digit_string_ids_are_accepted(db):
+    database, image, label = db
+    result, error = database.save_annotations(create=[box(image, label, label_id=str(label["id"]))])
+    assert error is None
+    annotation = result[image["uuid"]][0]
+    _, error = database.save_annotations(delete=[str(annotation["id"])])
+    assert error is None
+
+@pytest.mark.parametrize("payload", [
+    {"delete": [{"id": 1}]},
+    {"delete": ["1", 2]},
+    {"delete": [True]},
+    {"create": ["not an object"]},
+    {"update": [{"id": [1]}]},
+    {"update": [{"id": 1, "label_id": "cat"}]},
+])
+def test_malformed_ids_are_rejected(db, payload):
+    database, _, _ = db
+    result, error = database.save_annotations(**payload)
+    assert result is None and error
+
+@pytest.mark.parametrize("fields", [
+    {"image_uuid": ["a"]},
+    {"label_id": None},
+    {"x": "left"},
+    {"width": float("nan")},
+    {"height": None},
+])
+def test_malformed_creates_are_rejected(db, fields):
+    database, image, label = db
+    result, error = database.save_annotations(create=[box(image, label, **fields)])
+    assert result is None and error
+    # Nothing was written
+    assert database.get_image_annotations(image["uuid"])[0] == []
@@ -0,0 +1,58 @@
+import io
+import os
+
+from werkzeug.datastructures import FileStorage
+
+from dataset_exporter import DatasetExporter
+
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de"
+    "0000000c4944415408d763f8cfc000000301010018dd8db00000000049454e44ae426082"
+)
+
+def add_project(projects):
+    projects.add_project({"name": "p", "description": "d"})
+    return projects.get_projects()[-1]["uuid"]
+
+def upload(projects, project_uuid, data=PNG, filename="a.png"):
+    image, error = projects.upload_image(project_uuid, FileStorage(io.BytesIO(data), filename))
+    assert error is None
+    return image
+
+def test_identical_uploads_share_one_blob(projects, project_uuid):
+    first, second = upload(projects, project_uuid), upload(projects, project_uuid)
+
+    assert first["content_hash"] == second["content_hash"]
+    blob = projects.blobs.blob_path(first["content_hash"])
+    assert os.path.samefile(blob, os.path.join(projects.root, first["file_path"]))
+    assert os.path.samefile(blob, os.path.join(projects.root, second["file_path"]))
+
+def test_blob_outlives_exports_and_goes_with_last_image(projects, project_uuid, workdir):
+    first, second = upload(projects, project_uuid), upload(projects, project_uuid)
+    blob = projects.blobs.blob_path(first["content_hash"])
+    # Only annotated images are exported
+    label, _ = projects.add_label(project_uuid, "cat")
+    for image in (first, second):
+        projects.add_annotation(image["uuid"], label["id"], 0.1, 0.1, 0.5, 0.5)
+
+    export_dir = workdir / "export"
+    DatasetExporter(project_uuid, str(export_dir), root=projects.root).export_dataset()
+
+    assert projects.delete_image(first["uuid"])[0]
+    assert os.path.exists(blob)
+    assert projects.delete_image(second["uuid"])[0]
+    # Hard links of the export don't count as references
+    assert not os.path.exists(blob)
+    exported = [os.path.join(root, name) for root, _, names in os.walk(export_dir / "images") for name in names]
+    assert exported and all(open(path, "rb").read() == PNG for path in exported)
+
+def test_project_delete_keeps_blobs_used_by_other_projects(projects, project_uuid):
+    first_project, second_project = project_uuid, add_project(projects)
+    image = upload(projects, first_project)
+    upload(projects, second_project)
+    blob = projects.blobs.blob_path(image["content_hash"])
+
+    assert projects.delete_project_by_uuid(first_project)
+    assert os.path.exists(blob)
+    assert projects.delete_project_by_uuid(second_project)
+    assert not os.path.exists(blob)
@@ -0,0 +1,99 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from dataset_exporter import DatasetExporter
+
+def add_image(database, project_uuid, workdir, name):
+    """Register a small JPEG stored under uploads/<project>/"""
+    file_path = os.path.join("uploads", project_uuid, name)
+    os.makedirs(workdir / "uploads" / project_uuid, exist_ok=True)
+    cv2.imwrite(str(workdir / file_path), np.zeros((8, 8, 3), np.uint8))
+    return database.add_project_image(project_uuid, name, file_path, 1, width=8, height=8)
+
+@pytest.fixture
+def exporter(database, project_uuid, workdir):
+    return DatasetExporter(project_uuid, str(workdir / "export"), root=str(workdir))
+
+def label_lines(export_dir):
+    return sorted(line for root, _, names in os.walk(export_dir / "labels") for name in names
+                  for line in open(os.path.join(root, name)).read().splitlines())
+
+def test_boxes_with_another_projects_label_are_dropped(database, project_uuid, exporter, workdir):
+    image = add_image(database, project_uuid, workdir, "a.jpg")
+    other = add_image(database, project_uuid, workdir, "b.jpg")
+    label, _ = database.add_label(project_uuid, "cat")
+    database.add_project({"name": "other", "description": "d"})
+    foreign, _ = database.add_label(database.get_projects()[-1]["uuid"], "dog")
+
+    assert database.add_annotation(image["uuid"], foreign["id"], 0.1, 0.1, 0.2, 0.2)[1]
+    # Rows written before add_annotation checked the label's project
+    database.add_annotations_bulk([
+        {"image_id": image["id"], "label_id": label["id"], "x": 0.0, "y": 0.0, "width": 0.5, "height": 0.5},
+        {"image_id": image["id"], "label_id": foreign["id"], "x": 0.1, "y": 0.1, "width": 0.2, "height": 0.2},
+        {"image_id": other["id"], "label_id": foreign["id"], "x": 0.1, "y": 0.1, "width": 0.2, "height": 0.2},
+    ])
+
+    stats = exporter.export_annotations()
+    assert stats["exported"] == 1 and stats["dropped"] == 2
+    assert label_lines(workdir / "export") == ["0 0.250000 0.250000 0.500000 0.500000"]
+
+def manifest_images(export_dir):
+    with open(export_dir / "manifest.json") as f:
+        return json.load(f)["images"]
+
+def test_incremental_export_rewrites_only_changed_images(database, project_uuid, exporter, workdir):
+    label, _ = database.add_label(project_uuid, "cat")
+    a = add_image(database, project_uuid, workdir, "a.jpg")
+    b = add_image(database, project_uuid, workdir, "b.jpg")
+    for image in (a, b):
+        database.add_annotation(image["uuid"], label["id"], 0.0, 0.0, 0.5, 0.5)
+
+    assert exporter.export_annotations(incremental=True)["exported"] == 2
+    assert set(manifest_images(workdir / "export")) == {a["uuid"], b["uuid"]}
+    stats = exporter.export_annotations(incremental=True)
+    assert (stats["exported"], stats["unchanged"]) == (0, 2)
+
+    database.add_annotation(b["uuid"], label["id"], 0.5, 0.5, 0.5, 0.5)
+    stats = exporter.export_annotations(incremental=True)
+    assert (stats["exported"], stats["unchanged"]) == (1, 1)
+    assert len(label_lines(workdir / "export")) == 3
+
+    # A label file removed behind the manifest's back is written again
+    entry = manifest_images(workdir / "export")[a["uuid"]]
+    os.remove(workdir / "export" / entry["label"])
+    stats = exporter.export_annotations(incremental=True)
+    assert (stats["exported"], stats["unchanged"]) == (1, 1)
+    assert os.path.exists(workdir / "export" / entry["label"])
+
+def test_deleted_images_are_pruned(database, project_uuid, exporter, workdir):
+    label, _ = database.add_label(project_uuid, "cat")
+    a = add_image(database, project_uuid, workdir, "a.jpg")
+    b = add_image(database, project_uuid, workdir, "b.jpg")
+    for image in (a, b):
+        database.add_annotation(image["uuid"], label["id"], 0.0, 0.0, 0.5, 0.5)
+    exporter.export_annotations()
+    entry = manifest_images(workdir / "export")[b["uuid"]]
+
+    database.delete_image(b["uuid"])
+    # Full exports prune too, not only incremental ones
+    stats = exporter.export_annotations()
+    assert (stats["exported"], stats["removed"]) == (1, 1)
+    assert list(manifest_images(workdir / "export")) == [a["uuid"]]
+    for key in ("image", "label"):
+        assert not os.path.exists(workdir / "export" / entry[key])
+    assert label_lines(workdir / "export") == ["0 0.250000 0.250000 0.500000 0.500000"]
+
+def test_unreadable_manifest_means_a_full_export(database, project_uuid, exporter, workdir):
+    label, _ = database.add_label(project_uuid, "cat")
+    image = add_image(database, project_uuid, workdir, "a.jpg")
+    database.add_annotation(image["uuid"], label["id"], 0.0, 0.0, 0.5, 0.5)
+    exporter.export_annotations(incremental=True)
+
+    (workdir / "export" / "manifest.json").write_text("{truncated")
+    stats = exporter.export_annotations(incremental=True)
+    assert (stats["exported"], stats["unchanged"]) == (1, 0)
+    assert list(manifest_images(workdir / "export")) == [image["uuid"]]
@@ -0,0 +1,167 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+
+from dataset_importer import DatasetImporter, iter_archive, parse_class_names
+
+@pytest.fixture
+def project(database, project_uuid):
+    image = database.add_project_image(project_uuid, "a.jpg", "uploads/a.jpg", 1, width=200, height=100)
+    return database, project_uuid, image
+
+def boxes(database, image):
+    annotations, _ = database.get_image_annotations(image["uuid"])
+    return [(a["label"]["id"], round(a["x"], 6), round(a["y"], 6), round(a["width"], 6), round(a["height"], 6))
+            for a in annotations]
+
+def labels(database, project_uuid):
+    project_labels, _ = database.get_project_labels(project_uuid)
+    return {label["name"]: label["id"] for label in project_labels}
+
+def test_from_yolo_converts_and_validates():
+    rows = np.array([
+        [0, 0.5, 0.5, 0.2, 0.4],   # valid
+        [1, 0.05, 0.5, 0.2, 0.2],  # clipped at the left edge
+        [-1, 0.5, 0.5, 0.2, 0.2],  # negative class
+        [1.5, 0.5, 0.5, 0.2, 0.2], # fractional class
+        [0, 50, 50, 20, 20],       # pixels, not normalized
+        [0, 0.5, 0.5, 0, 0.2],     # empty box
+        [0, np.nan, 0.5, 0.2, 0.2],
+    ])
+    valid, class_ids, converted = DatasetImporter.from_yolo(rows)
+    assert valid.tolist() == [True, True, False, False, False, False, False]
+    assert class_ids[:2].tolist() == [0, 1]
+    np.testing.assert_allclose(converted[0], [0.4, 0.3, 0.2, 0.4])
+    np.testing.assert_allclose(converted[1], [0.0, 0.4, 0.15, 0.2])
+
+def test_from_coco_normalizes_and_validates():
+    bboxes = np.array([
+        [20, 10, 40, 50],   # valid
+        [180, 0, 40, 10],   # clipped at the right edge
+        [0, 0, 0, 10],      # empty box
+        [10, 10, 10, 10],   # image without a size
+        [300, 0, 10, 10],   # outside the image
+    ], dtype=np.float64)
+    sizes = np.array([[200, 100], [200, 100], [200, 100], [np.nan, np.nan], [200, 100]], dtype=np.float64)
+    valid, converted = DatasetImporter.from_coco(bboxes, sizes)
+    assert valid.tolist() == [True, True, False, False, False]
+    np.testing.assert_allclose(converted[0], [0.1, 0.1, 0.2, 0.5])
+    np.testing.assert_allclose(converted[1], [0.9, 0.0, 0.1, 0.1])
+
+def test_class_names_from_files():
+    assert parse_class_names("classes.txt", "cat\n\ndog\n") == {0: "cat", 1: "dog"}
+    assert parse_class_names("data.yaml", "names: [cat, dog]\n") == {0: "cat", 1: "dog"}
+    assert parse_class_names("data.yaml", "names:\n  0: cat\n  '2': dog\n") == {0: "cat", 2: "dog"}
+    # Keys that aren't class ids are skipped, not an import error
+    assert parse_class_names("data.yaml", "names:\n  0: cat\n  bird: 1\n  ~: x\n") == {0: "cat"}
+    assert parse_class_names("data.yaml", "names: [cat\n") == {}
+    assert parse_class_names("data.yaml", "- cat\n") == {}
+
+def test_yolo_import_creates_labels_and_matches_by_stem(project):
+    database, project_uuid, image = project
+    database.add_label(project_uuid, "cat")
+    stats = DatasetImporter(project_uuid).import_yolo(
+        {"labels/a.txt": "0 0.5 0.5 0.2 0.4\n1 0.5 0.5 0.2 0.4\n0 0.1 0.1 0.1 0.1 0.2 0.2\n",
+         "labels/b.txt": "0 0.5 0.5 0.2 0.4\n"},
+        class_names={0: "cat"})
+    assert stats == {"annotations": 2, "labels": 2, "invalid": 1, "unmatched": 1}
+
+    label_ids = labels(database, project_uuid)
+    assert set(label_ids) == {"cat", "1"}
+    assert sorted(boxes(database, image)) == sorted([
+        (label_ids["cat"], 0.4, 0.3, 0.2, 0.4), (label_ids["1"], 0.4, 0.3, 0.2, 0.4)
+    ])
+
+def test_coco_import_uses_categories_and_image_sizes(project):
+    database, project_uuid, image = project
+    coco = {
+        "images": [{"id": 7, "file_name": "train/a.jpg"}, {"id": 8, "file_name": "missing.jpg"}],
+        "categories": [{"id": 3, "name": "dog"}],
+        "annotations": [
+            {"image_id": 7, "category_id": 3, "bbox": [20, 10, 40, 50]},
+            {"image_id": 7, "category_id": 4, "bbox": [20, 10, 40, 50]},
+            {"image_id": 8, "category_id": 3, "bbox": [20, 10, 40, 50]},
+            "not an annotation",
+        ],
+    }
+    stats = DatasetImporter(project_uuid).import_coco(coco)
+    assert stats == {"annotations": 1, "labels": 1, "invalid": 3, "unmatched": 1}
+    label_ids = labels(database, project_uuid)
+    assert list(label_ids) == ["dog"]
+    assert boxes(database, image) == [(label_ids["dog"], 0.1, 0.1, 0.2, 0.5)]
+
+def test_failed_file_import_leaves_nothing_behind(project, workdir):
+    database, project_uuid, image = project
+    path = workdir / "labels.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("classes.txt", "cat\n")
+        archive.writestr("labels/a.txt", "0 0.5 0.5 0.2 0.4\n")
+        archive.writestr("coco.json", json.dumps({
+            "images": [{"id": 1, "file_name": "a.jpg"}],
+            "categories": [{"id": 1, "name": "dog"}],
+            "annotations": [{"image_id": 1, "category_id": 1, "bbox": [0, 0, 10, 10]}],
+        }))
+
+    def cancel(done, total):
+        # Cancel once the YOLO labels are in and the COCO file is being imported
+        if done * 4 > total * 3:
+            raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        DatasetImporter(project_uuid).import_file(str(path), progress=cancel)
+    database.session.expire_all()
+    assert labels(database, project_uuid) == {}
+    assert boxes(database, image) == []
+
+    reported = []
+    stats = DatasetImporter(project_uuid).import_file(str(path), progress=lambda *p: reported.append(p))
+    assert stats["annotations"] == 2
+    assert set(labels(database, project_uuid)) == {"cat", "dog"}
+    fractions = [done / total for done, total in reported]
+    assert fractions == sorted(fractions) and fractions[-1] == 1
+
+def test_invalid_json_member_is_rejected(project, workdir):
+    _, project_uuid, _ = project
+    path = workdir / "labels.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("coco.json", "{not json")
+    with pytest.raises(ValueError, match="coco.json"):
+        DatasetImporter(project_uuid).import_file(str(path))
+
+def tar_gz(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def read_all(data):
+    return [(name, member.read()) for name, member, _ in iter_archive(io.BytesIO(data))]
+
+def test_truncated_tar_is_a_value_error():
+    data = tar_gz({"labels/a.txt": os.urandom(100000), "labels/b.txt": b"0 0.5 0.5 0.2 0.4\n"})
+    assert [name for name, _ in read_all(data)] == ["labels/a.txt", "labels/b.txt"]
+    # Cut off in the middle of the first member
+    with pytest.raises(ValueError, match="Corrupt archive"):
+        read_all(data[:len(data) // 2])
+
+def test_corrupt_zip_member_is_a_value_error():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("labels/a.txt", "0 0.5 0.5 0.2 0.4\n" * 1000)
+    data = bytearray(buffer.getvalue())
+    # Flip a byte of the compressed member data, after its local header
+    data[60] ^= 0xff
+    with pytest.raises(ValueError, match="Corrupt archive"):
+        read_all(bytes(data))
+
+def test_other_files_are_not_archives():
+    with pytest.raises(ValueError, match="Not a ZIP or tar archive"):
+        read_all(b"just some text")
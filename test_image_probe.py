@@ -0,0 +1,52 @@
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from image_probe import get_image_size
+
+IMAGE = np.random.default_rng(0).integers(0, 255, (30, 50, 3), dtype=np.uint8)
+
+def exif_segment(orientation):
+    """APP1 segment with a little-endian EXIF block holding only the orientation tag"""
+    tiff = b"II*\x00" + struct.pack("<I", 8) + struct.pack("<H", 1) \
+        + struct.pack("<HHIHH", 0x0112, 3, 1, orientation, 0) + struct.pack("<I", 0)
+    payload = b"Exif\x00\x00" + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+def imread_size(path):
+    image = cv2.imread(str(path))
+    return image.shape[1], image.shape[0]
+
+@pytest.mark.parametrize("ext, params", [
+    ("jpg", []),
+    ("png", []),
+    ("gif", []),
+    ("bmp", []),
+    ("webp", [cv2.IMWRITE_WEBP_QUALITY, 80]),   # lossy, VP8
+    ("webp", [cv2.IMWRITE_WEBP_QUALITY, 101]),  # lossless, VP8L
+])
+def test_size_matches_imread(tmp_path, ext, params):
+    path = tmp_path / f"image.{ext}"
+    assert cv2.imwrite(str(path), IMAGE, params)
+    assert get_image_size(str(path)) == imread_size(path) == (50, 30)
+
+@pytest.mark.parametrize("orientation, size", [(1, (50, 30)), (3, (50, 30)), (6, (30, 50)), (8, (30, 50))])
+def test_jpeg_exif_orientation_matches_imread(tmp_path, orientation, size):
+    path = tmp_path / "rotated.jpg"
+    _, encoded = cv2.imencode(".jpg", IMAGE)
+    encoded = encoded.tobytes()
+    # The EXIF block goes right after the start-of-image marker, as cameras write it
+    path.write_bytes(encoded[:2] + exif_segment(orientation) + encoded[2:])
+    assert get_image_size(str(path)) == imread_size(path) == size
+
+def test_unknown_or_truncated_files_have_no_size(tmp_path):
+    text = tmp_path / "notes.txt"
+    text.write_text("not an image")
+    _, encoded = cv2.imencode(".jpg", IMAGE)
+    truncated = tmp_path / "truncated.jpg"
+    truncated.write_bytes(encoded.tobytes()[:20])
+    assert get_image_size(str(text)) is None
+    assert get_image_size(str(truncated)) is None
+    assert get_image_size(str(tmp_path / "missing.png")) is None
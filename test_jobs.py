@@ -0,0 +1,35 @@
+import pytest
+
+from jobs import JobsController
+
+@pytest.fixture
+def jobs(workdir, database):
+    jobs = JobsController(str(workdir))
+    yield jobs
+    jobs.wait()
+
+def test_export_job_runs_in_a_spawned_worker(jobs, database, project_uuid):
+    job, error = jobs.submit_export(project_uuid)
+    assert error is None
+    jobs.wait()
+    database.session.expire_all()
+    finished = database.get_job(job["uuid"])
+    assert finished["status"] == "completed", finished["error"]
+    assert finished["result"]["yaml_path"].endswith("dataset.yaml")
+
+def test_only_the_first_server_process_recovers(jobs, workdir, database, project_uuid):
+    running = database.add_job("export", {}, project_uuid)
+    database.claim_job(running["uuid"])
+
+    # Each controller opens the lock file itself, as separate processes would
+    other = JobsController(str(workdir))
+    assert jobs.recover_on_startup()
+    database.session.expire_all()
+    assert database.get_job(running["uuid"])["status"] == "failed"
+
+    # Started while the first one runs: its running jobs are left alone
+    database.claim_job(database.add_job("export", {}, project_uuid)["uuid"])
+    assert not other.recover_on_startup()
+    assert not jobs.recover_on_startup()
+    database.session.expire_all()
+    assert [job["status"] for job in database.get_jobs(status=["running"], limit=None)] == ["running"]
@@ -0,0 +1,40 @@
+import pytest
+
+@pytest.fixture
+def images(database, project_uuid):
+    return [database.add_project_image(project_uuid, f"{i}.jpg", f"uploads/{i}.jpg", 1, width=8, height=8)
+            for i in range(7)]
+
+def pages(projects, project_uuid, limit, **filters):
+    """Follow next_cursor from the first page to the last"""
+    result, after = [], None
+    while True:
+        page, after = projects.get_project_images_page(project_uuid, limit=limit, after=after, **filters)
+        result.append([image["id"] for image in page])
+        if after is None:
+            return result
+
+def test_pages_cover_every_image_once(projects, project_uuid, images):
+    ids = [image["id"] for image in images]
+    assert pages(projects, project_uuid, 3) == [ids[0:3], ids[3:6], ids[6:7]]
+    assert pages(projects, project_uuid, 3, order="desc") == [ids[6:3:-1], ids[3:0:-1], ids[0:1]]
+
+def test_last_page_has_no_cursor(projects, project_uuid, images):
+    ids = [image["id"] for image in images]
+    # A page that ends exactly at the last image is the last page
+    assert pages(projects, project_uuid, 7) == [ids]
+    assert pages(projects, project_uuid, 10) == [ids]
+    assert projects.get_project_images_page(project_uuid, limit=3, after=ids[-1]) == ([], None)
+
+def test_filters_apply_before_paging(database, projects, project_uuid, images):
+    cat, _ = database.add_label(project_uuid, "cat")
+    dog, _ = database.add_label(project_uuid, "dog")
+    for image in images[1::2]:
+        database.add_annotation(image["uuid"], cat["id"], 0.1, 0.1, 0.2, 0.2)
+    database.add_annotation(images[4]["uuid"], dog["id"], 0.1, 0.1, 0.2, 0.2)
+    ids = [image["id"] for image in images]
+
+    assert pages(projects, project_uuid, 2, annotated=True) == [[ids[1], ids[3]], [ids[4], ids[5]]]
+    assert pages(projects, project_uuid, 2, annotated=False) == [[ids[0], ids[2]], [ids[6]]]
+    assert pages(projects, project_uuid, 2, label_id=cat["id"]) == [[ids[1], ids[3]], [ids[5]]]
+    assert pages(projects, project_uuid, 2, label_id=dog["id"]) == [[ids[4]]]
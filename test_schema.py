@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
+
+from database import models
+
+@pytest.fixture
+def engine(workdir):
+    engine = create_engine("sqlite:///db.sqlite")
+    models.Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+def test_upgrade_adds_missing_nullable_columns(engine):
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE project_images DROP COLUMN width"))
+    models.upgrade_schema(engine)
+    assert "width" in {column["name"] for column in inspect(engine).get_columns("project_images")}
+
+def test_column_added_by_another_process_is_not_an_error(engine, monkeypatch):
+    class StaleInspector:
+        """Columns as read before another worker's ALTER TABLE went through"""
+        def __init__(self, engine):
+            self.inspector = inspect(engine)
+
+        def get_columns(self, table_name):
+            columns = self.inspector.get_columns(table_name)
+            return [column for column in columns if (table_name, column["name"]) != ("project_images", "width")]
+
+    calls = []
+    def stale_once(engine):
+        calls.append(engine)
+        return StaleInspector(engine) if len(calls) == 1 else inspect(engine)
+
+    monkeypatch.setattr(models, "inspect", stale_once)
+    models.upgrade_schema(engine)
+    assert len(calls) == 2  # Re-checked after the duplicate column error
+
+def test_other_alter_errors_are_raised(engine, monkeypatch):
+    class MissingTableInspector:
+        def __init__(self, engine):
+            self.inspector = inspect(engine)
+
+        def get_columns(self, table_name):
+            if table_name == "project_images":
+                return []
+            return self.inspector.get_columns(table_name)
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE project_images"))
+    monkeypatch.setattr(models, "inspect", MissingTableInspector)
+    with pytest.raises(OperationalError):
+        models.upgrade_schema(engine)
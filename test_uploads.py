@@ -0,0 +1,88 @@
+import datetime
+import io
+import os
+
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de"
+    "0000000c4944415408d763f8cfc000000301010018dd8db00000000049454e44ae426082"
+)
+
+def create(projects, project_uuid, size=len(PNG), filename="a.png", kind="image"):
+    upload, status = projects.create_upload(project_uuid, filename, kind, size)
+    assert status == 201 and upload["offset"] == 0
+    return upload["uuid"]
+
+def put(projects, upload_uuid, offset, data):
+    return projects.write_upload_chunk(upload_uuid, offset, io.BytesIO(data))
+
+def test_chunks_resume_at_the_reported_offset(projects, project_uuid):
+    upload_uuid = create(projects, project_uuid)
+
+    upload, status = put(projects, upload_uuid, 0, PNG[:20])
+    assert status == 200 and upload["offset"] == 20
+    # A retried chunk for an offset already written is refused
+    body, status = put(projects, upload_uuid, 0, PNG[:20])
+    assert status == 409 and body["offset"] == 20
+    # So is a chunk past the declared size, which leaves the offset alone
+    body, status = put(projects, upload_uuid, 20, PNG[20:] + b"x")
+    assert status == 413 and body["offset"] == 20
+    assert projects.get_upload(upload_uuid)[0]["offset"] == 20
+
+    body, status = projects.complete_upload(upload_uuid)
+    assert status == 409 and body["offset"] == 20
+
+    upload, status = put(projects, upload_uuid, 20, PNG[20:])
+    assert status == 200 and upload["offset"] == len(PNG)
+
+def test_complete_registers_the_image_once(projects, project_uuid):
+    upload_uuid = create(projects, project_uuid)
+    put(projects, upload_uuid, 0, PNG)
+
+    upload, status = projects.complete_upload(upload_uuid)
+    assert status == 200 and upload["status"] == "completed"
+    image = upload["result"]["image"]
+    assert (image["width"], image["height"], image["original_filename"]) == (1, 1, "a.png")
+    assert open(os.path.join(projects.root, image["file_path"]), "rb").read() == PNG
+
+    again, status = projects.complete_upload(upload_uuid)
+    assert status == 200 and again["result"] == upload["result"]
+    assert len(projects.database.get_project_images(project_uuid)) == 1
+    assert put(projects, upload_uuid, len(PNG), b"x")[1] == 409
+
+def test_locked_staging_file_refuses_other_writers(projects, project_uuid):
+    import fcntl
+    upload_uuid = create(projects, project_uuid)
+    path = projects._staging_path(projects.database.get_upload(upload_uuid))
+
+    # Another worker process writing a chunk holds the same lock
+    with open(path, "r+b") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        assert put(projects, upload_uuid, 0, PNG)[1] == 409
+        assert projects.complete_upload(upload_uuid)[1] == 409
+        assert projects.abort_upload(upload_uuid)[1] == 409
+    assert put(projects, upload_uuid, 0, PNG)[1] == 200
+
+def test_delete_removes_the_staging_file(projects, project_uuid):
+    upload_uuid = create(projects, project_uuid)
+    path = projects._staging_path(projects.database.get_upload(upload_uuid))
+    put(projects, upload_uuid, 0, PNG[:10])
+
+    assert projects.abort_upload(upload_uuid)[1] == 200
+    assert not os.path.exists(path)
+    assert projects.get_upload(upload_uuid)[1] == 404
+
+def test_abandoned_uploads_expire(projects, project_uuid):
+    stale, active, done = (create(projects, project_uuid) for _ in range(3))
+    put(projects, done, 0, PNG)
+    projects.complete_upload(done)
+    month_ago = datetime.datetime.now() - datetime.timedelta(days=30)
+    for upload_uuid in (stale, active, done):
+        projects.database.update_upload(upload_uuid, created_at=str(month_ago))
+    # Only the stale upload stopped receiving chunks
+    stale_path = projects._staging_path(projects.database.get_upload(stale))
+    os.utime(stale_path, (month_ago.timestamp(), month_ago.timestamp()))
+
+    assert projects.expire_uploads(max_age=datetime.timedelta(days=1)) == 1
+    assert projects.get_upload(stale)[1] == 404 and not os.path.exists(stale_path)
+    assert projects.get_upload(active)[1] == 200
+    assert projects.get_upload(done)[1] == 200
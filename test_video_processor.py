@@ -0,0 +1,33 @@
+import os
+
+import cv2
+import numpy as np
+
+from video_processor import VideoProcessor
+
+def write_video(path, frames=400):
+    """A bar sliding right one pixel every third frame"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 25, (64, 48))
+    for i in range(frames):
+        frame = np.zeros((48, 64, 3), np.uint8)
+        frame[:, (i // 3) % 60:(i // 3) % 60 + 4] = 255
+        writer.write(frame)
+    writer.release()
+
+def test_parallel_dedup_matches_a_single_process(tmp_path):
+    video = tmp_path / "v.avi"
+    write_video(video)
+
+    results = {}
+    for workers in (1, 4):
+        output_dir = tmp_path / f"out{workers}"
+        output_dir.mkdir()
+        with VideoProcessor(str(video), str(output_dir)) as processor:
+            frames = [frame["index"] for frame in processor.iter_frames(workers=workers, dedup_threshold=2)]
+            on_disk = sorted(int(name.rsplit("_", 1)[1].split(".")[0]) for name in os.listdir(output_dir))
+            results[workers] = frames, on_disk, processor.stats
+
+    frames, on_disk, stats = results[1]
+    assert 1 < len(frames) < 400 and on_disk == frames
+    # Ranges start from the last frame kept before them, not from scratch
+    assert results[4] == (frames, on_disk, stats)